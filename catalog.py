@@ -0,0 +1,161 @@
+"""
+文档清单：只读取元数据及第一页文本，快速列出大量pdf的标题、是否有水印、页数。
+清单以csv保存，可作为批处理的任务列表，提取图表时直接使用其中的标题，不再解析第一页字符
+"""
+import csv
+import multiprocessing
+import os
+import re
+import time
+
+from config import Config
+from exclusions import Title
+from log import get_logger, get_worker_queue, init_worker, log_event
+
+logger = get_logger('catalog')
+
+TITLE_COMPILE = re.compile(r'(第\d+期\s.*?.*?)\.pdf')
+# fitz无法映射为unicode的字符，即pdfplumber中的'(cid:x)'
+UNMAPPED_CHAR = '�'
+
+# 进程池每次分给子进程的文档数
+CHUNK_SIZE = 16
+
+FIELDS = ['path', 'title', 'watermark', 'pages', 'bytes', 'meta_title', 'status']
+
+# 各进程已读取的清单：{清单位置: {pdf路径: 行}}
+_catalogs = dict()
+
+
+def title_from_path(path) -> str:
+    res = TITLE_COMPILE.search(path)
+    if res and res[1]:
+        return res[1]
+
+    return path.split('/')[-1].strip('.pdf')
+
+
+def resolve_title(path, first_page_title='') -> str:
+    """
+    文章标题：优先取文件名中的期号及标题，取不到时为第一页的大字号文本。
+    是否有水印只记入清单，不影响标题，图表、目录结果的目录名与原来一致
+    :param path: pdf路径
+    :param first_page_title: 第一页中字号不小于`Title.size`的文本，遇到无法识别的字符即停止
+    :return:
+    """
+    title = title_from_path(path)
+    return title if title else first_page_title
+
+
+def read_entry(path) -> dict:
+    """
+    读取一篇文档的清单信息，fitz打开文档时只解析交叉引用表，只加载第一页
+    :param path: pdf路径
+    :return: 字段见`FIELDS`
+    """
+    import fitz
+
+    entry = dict(path=path, title='', watermark=False, pages=0, bytes=0, meta_title='', status='ok')
+    first_page_title = ''
+
+    try:
+        entry['bytes'] = os.path.getsize(path)
+        with fitz.open(path) as doc:
+            entry['pages'] = doc.page_count
+            entry['meta_title'] = (doc.metadata or {}).get('title') or ''
+
+            if doc.page_count:
+                blocks = doc.load_page(0).get_text('dict')['blocks']
+                for span in (s for b in blocks for line in b.get('lines', []) for s in line['spans']):
+                    if UNMAPPED_CHAR in span['text']:
+                        entry['watermark'] = True
+                        break
+                    if span['size'] >= Title.size:
+                        first_page_title += span['text']
+    except Exception as e:
+        entry['status'] = 'error'
+        logger.error('%s 读取失败：%s', path, e)
+
+    entry['title'] = resolve_title(path, first_page_title.strip())
+    return entry
+
+
+def build_catalog(config: Config = None, root=None, workers=None) -> int:
+    """
+    递归列出`root`（默认为`ARTICLE_PATH`）下的所有pdf，多进程读取后写入`CATALOG_PATH`
+    :param config:
+    :param root: 归档目录
+    :param workers: 进程数，默认为`WORKERS`
+    :return: 文档数
+    """
+    from jobs import iter_pdfs
+
+    config = config or Config()
+    root = root or config.article_path
+    workers = max(1, workers or config.workers)
+    start, count, errors = time.time(), 0, 0
+
+    dir_name = os.path.dirname(config.catalog_path)
+    if dir_name and not os.path.exists(dir_name):
+        os.makedirs(dir_name, exist_ok=True)
+
+    # 逐行写入临时文件，完成后替换，中途退出不影响已有清单
+    tmp = config.catalog_path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, FIELDS)
+        writer.writeheader()
+
+        # 子进程处理约`WORKER_MAX_DOCS`篇文档后重启，释放fitz的缓存
+        max_tasks = max(1, config.worker_max_docs // CHUNK_SIZE) if config.worker_max_docs else None
+        pool = multiprocessing.Pool(
+            workers, initializer=init_worker, initargs=(get_worker_queue(),), maxtasksperchild=max_tasks
+        )
+        with pool:
+            for entry in pool.imap_unordered(read_entry, iter_pdfs(root), chunksize=CHUNK_SIZE):
+                writer.writerow(entry)
+                count += 1
+                errors += entry['status'] != 'ok'
+
+    os.replace(tmp, config.catalog_path)
+    _catalogs.pop(config.catalog_path, None)
+
+    log_event('catalog', path=config.catalog_path, documents=count, errors=errors,
+              seconds=round(time.time() - start, 3))
+    return count
+
+
+def read_catalog(fpath) -> dict:
+    """
+    读取清单
+    :param fpath: 清单位置
+    :return: {pdf路径: 行}，按清单中的顺序
+    """
+    if fpath in _catalogs:
+        return _catalogs[fpath]
+
+    entries = dict()
+    with open(fpath, encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            row['watermark'] = row['watermark'] == 'True'
+            row['pages'] = int(row['pages'])
+            row['bytes'] = int(row['bytes'])
+            entries[row['path']] = row
+
+    _catalogs[fpath] = entries
+    return entries
+
+
+def iter_catalog_paths(config: Config):
+    """清单中读取成功的pdf路径，清单中的顺序为各进程完成的顺序，这里按路径排序"""
+    for path, row in sorted(read_catalog(config.catalog_path).items()):
+        if row['status'] == 'ok':
+            yield path
+
+
+def get_title(config: Config, path):
+    """清单中的文章标题，清单不存在或不包含该文档时返回None"""
+    if not os.path.exists(config.catalog_path):
+        return None
+
+    row = read_catalog(config.catalog_path).get(path)
+    return row['title'] if row else None
@@ -0,0 +1,214 @@
+"""
+命令行入口
+
+    python cli.py extract toc|figures|both [pdf ...] [--articles 目录] [--supervised | --distributed] [--use-catalog]
+    python cli.py catalog [--workers 进程数]
+    python cli.py status
+    python cli.py index
+    python cli.py search 查询语句
+
+各解析库只在对应任务中导入，输出目录在写入结果时才创建
+"""
+import argparse
+import os
+import sys
+import time
+
+from config import Config
+from log import log_event, setup
+from tasks import TASKS, extract_toc, get_toc_index, iter_pdf_paths, run_document
+
+
+def extract(args, config: Config):
+    if args.supervised:
+        from supervisor import Supervisor
+        Supervisor(args.target, config).run(iter_pdf_paths(config, args.pdfs))
+        return
+
+    if args.distributed:
+        from jobs import run_distributed
+        run_distributed(args.target, config)
+        return
+
+    from memory import MemoryGovernor
+
+    start, count = time.time(), 0
+    governor = MemoryGovernor(config)
+
+    toc_index = None
+    if extract_toc in TASKS[args.target] and config.update_toc_index:
+        toc_index = get_toc_index(config)
+
+    exporter = None
+    if config.metrics_path:
+        from metrics import start_exporter
+        exporter = start_exporter(config)
+
+    try:
+        for path in iter_pdf_paths(config, args.pdfs):
+            result = run_document(args.target, path, config, toc_index)
+            count += 1
+            governor.after_document()
+
+            if exporter is not None:
+                exporter.metrics.record_document(result)
+                exporter.metrics.set_rss()
+    finally:
+        if toc_index is not None:
+            toc_index.close()
+        if exporter is not None:
+            exporter.stop()
+
+    log_event('batch', task=args.target, documents=count, seconds=round(time.time() - start, 3))
+
+
+def catalog(args, config: Config):
+    from catalog import build_catalog
+
+    count = build_catalog(config)
+    print('清单：{}，共{}篇'.format(config.catalog_path, count))
+
+
+def iter_result_files(config: Config):
+    """
+    `RESULT_PATH`中已保存的目录，含按子目录保存的结果
+    :return: (相对`RESULT_PATH`、不含后缀的文件名, 文件路径)
+    """
+    suffix = '.' + config.toc_format
+
+    for dir_path, _, files in os.walk(config.result_path):
+        rel_dir = os.path.relpath(dir_path, config.result_path)
+        for file_name in sorted(files):
+            if file_name.endswith(suffix):
+                name = file_name[:-len(suffix)]
+                yield (name if rel_dir == '.' else '/'.join([rel_dir, name])), os.path.join(dir_path, file_name)
+
+
+def status(args, config: Config):
+    from jobs import iter_pdfs
+
+    if not os.path.isdir(config.article_path):
+        print('pdf目录不存在：{}'.format(config.article_path))
+        return 1
+
+    pdfs = list(iter_pdfs(config.article_path))
+    names = {
+        '/'.join(filter(None, [config.relative_dir(p), os.path.basename(p)[:-len('.pdf')]])) for p in pdfs
+    }
+
+    tocs = {name for name, _ in iter_result_files(config)}
+
+    figures = set()
+    for dir_path, _, files in os.walk(config.image_save_path):
+        if any(f.endswith('.png') for f in files):
+            figures.add(dir_path)
+
+    print('pdf：{}'.format(len(pdfs)))
+    print('已生成目录：{}'.format(len(names & tocs)))
+    print('已提取图表：{}'.format(len(figures)))
+
+    if os.path.exists(config.job_path):
+        counts = dict(done=0, lease=0, failed=0)
+        for _, _, files in os.walk(config.job_path):
+            for f in files:
+                suffix = f.rsplit('.', 1)[-1]
+                if suffix in counts:
+                    counts[suffix] += 1
+
+        print('分布式任务：已完成{done}，处理中{lease}，曾失败{failed}'.format(**counts))
+
+
+def index(args, config: Config):
+    """根据`RESULT_PATH`中已保存的目录更新索引，只处理索引后有变动的文件"""
+    from toc_index import read_tree
+
+    if not os.path.exists(config.result_path):
+        return
+
+    count = 0
+
+    with get_toc_index(config) as toc_index:
+        for name, fpath in iter_result_files(config):
+            doc_path = '/'.join([config.article_path, name + '.pdf'])
+            if os.path.getmtime(fpath) <= toc_index.updated_at(doc_path):
+                continue
+
+            toc_index.add_tree(doc_path, read_tree(fpath))
+            count += 1
+
+    print('更新索引：{}'.format(count))
+
+
+def search(args, config: Config):
+    with get_toc_index(config) as toc_index:
+        for item in toc_index.search(args.query, args.limit):
+            print('{document}  p{page}  {path}'.format(**item))
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='提取期刊文章目录及图表')
+    parser.add_argument('--articles', dest='article_path', help='pdf所在目录')
+    parser.add_argument('--results', dest='result_path', help='目录结果存放位置')
+    parser.add_argument('--images', dest='image_path', help='图表存放位置')
+    parser.add_argument('--toc-format', dest='toc_format', choices=['json', 'jsonl'], help='目录结果格式')
+    parser.add_argument('--index', dest='toc_index_path', help='目录索引位置')
+    parser.add_argument('--catalog', dest='catalog_path', help='文档清单位置')
+    parser.add_argument('--jobs', dest='job_path', help='分布式处理的任务目录，需为各节点共享的目录')
+    parser.add_argument('--logs', dest='log_path', help='日志位置')
+    parser.add_argument('--log-level', dest='log_level', help='日志级别')
+
+    sub_parsers = parser.add_subparsers(dest='command', required=True)
+
+    extract_parser = sub_parsers.add_parser('extract', help='提取目录和（或）图表')
+    extract_parser.add_argument('target', choices=sorted(TASKS))
+    extract_parser.add_argument('pdfs', nargs='*', help='待处理的pdf，默认为ARTICLE_PATH下的所有pdf')
+    extract_parser.add_argument('--supervised', action='store_true', help='多进程处理，超时、崩溃的文档重试或隔离')
+    extract_parser.add_argument('--distributed', action='store_true', help='多机分布式处理ARTICLE_PATH下的所有pdf')
+    extract_parser.add_argument('--workers', type=int, help='进程数')
+    extract_parser.add_argument(
+        '--sections', dest='export_sections', action='store_true', default=None,
+        help='生成目录时同时按标题导出正文到SECTION_PATH'
+    )
+    extract_parser.add_argument(
+        '--use-catalog', dest='use_catalog', action='store_true', default=None,
+        help='以文档清单作为任务列表，并使用其中的标题'
+    )
+    extract_parser.set_defaults(func=extract)
+
+    catalog_parser = sub_parsers.add_parser('catalog', help='只读取第一页，列出所有pdf的标题、水印、页数')
+    catalog_parser.add_argument('--workers', type=int, help='进程数')
+    catalog_parser.set_defaults(func=catalog)
+
+    status_parser = sub_parsers.add_parser('status', help='查看处理进度')
+    status_parser.set_defaults(func=status)
+
+    index_parser = sub_parsers.add_parser('index', help='根据已生成的目录更新索引')
+    index_parser.set_defaults(func=index)
+
+    search_parser = sub_parsers.add_parser('search', help='在目录索引中查找标题')
+    search_parser.add_argument('query')
+    search_parser.add_argument('--limit', type=int, default=20)
+    search_parser.set_defaults(func=search)
+
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+
+    options = {
+        k: getattr(args, k)
+        for k in [
+            'article_path', 'result_path', 'image_path', 'toc_format', 'toc_index_path', 'log_path', 'log_level',
+            'workers', 'job_path', 'catalog_path', 'use_catalog', 'export_sections'
+        ]
+        if getattr(args, k, None) is not None
+    }
+    config = Config(**options)
+    setup(config)
+
+    return args.func(args, config)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+将页面中相距不超过一定间隔的矩形、曲线、图片聚为一个图表区域
+"""
+from typing import List, Tuple, Callable
+
+Coordinates = Tuple[float, float, float, float]
+
+
+class UnionFind(object):
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+
+        # 路径压缩
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+
+        return root
+
+    def union(self, i, j):
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            self.parent[rj] = ri
+
+        return ri
+
+
+def merge_box(c1: Coordinates, c2: Coordinates) -> Coordinates:
+    return min(c1[0], c2[0]), min(c1[1], c2[1]), max(c1[2], c2[2]), max(c1[3], c2[3])
+
+
+def is_near(c1: Coordinates, c2: Coordinates, gap) -> bool:
+    """两个矩形在水平、竖直方向上的间隔是否都不超过`gap`"""
+    return c1[0] - gap <= c2[2] and c2[0] - gap <= c1[2] \
+        and c1[1] - gap <= c2[3] and c2[1] - gap <= c1[3]
+
+
+def sweep(boxes: List[Coordinates], gap, is_blocked: Callable = None) -> List[Coordinates]:
+    """
+    按x0排序后扫描一遍，与当前仍在扫描范围内的区域相距不超过`gap`的矩形并入该区域，
+    区域扩大后再与其余仍在范围内的区域比较；各区域在其右边界加`gap`之后不再参与比较
+    """
+    # 各区域的外接矩形，被并入其他区域的为None
+    regions = []
+    active = []
+
+    for box in sorted(tuple(b) for b in boxes):
+        active = [i for i in active if regions[i][2] + gap >= box[0]]
+
+        merged = True
+        while merged:
+            merged = False
+            for i in active:
+                if not is_near(regions[i], box, gap):
+                    continue
+
+                region = merge_box(regions[i], box)
+                if is_blocked is not None and is_blocked(region):
+                    continue
+
+                box, regions[i] = region, None
+                active.remove(i)
+                merged = True
+                break
+
+        regions.append(box)
+        active.append(len(regions) - 1)
+
+    return sorted(r for r in regions if r is not None)
+
+
+def cluster_boxes(boxes: List[Coordinates], gap, is_blocked: Callable = None) -> List[Coordinates]:
+    """
+    将相距不超过`gap`的矩形（含经其他矩形间接相邻的）合并为区域。
+    区域扩大后可能与扫描时已移出范围的区域相邻，因此重复扫描直到区域数不再变化，
+    一般两遍即可，每遍的复杂度为O(n log n + n·k)，k为扫描范围内的区域数
+
+    :param boxes: 坐标列表
+    :param gap: 最大间隔
+    :param is_blocked: 判断合并后的区域是否不允许合并（如包含图表下标），参数为坐标
+    :return: 合并后的区域，按x0排序
+    """
+    regions = sweep(boxes, gap, is_blocked)
+    while True:
+        merged = sweep(regions, gap, is_blocked)
+        if len(merged) == len(regions):
+            return merged
+
+        regions = merged
@@ -1,14 +1,41 @@
+import os
+
 # 日志位置
 LOG_PATH = './logs'
+# 日志级别，DEBUG时记录每张图片、每个标题的详细信息
+LOG_LEVEL = 'INFO'
 ARTICLE_PATH = '/Users/joeyon/Desktop/期刊/原文/第二期'
 RESULT_PATH = 'files/results'
+# 目录结果格式：json为嵌套结构，jsonl为每行一个结点
+TOC_FORMAT = 'json'
+# 目录倒排索引位置，及生成目录时是否同时更新索引
+TOC_INDEX_PATH = 'files/toc_index.db'
+UPDATE_TOC_INDEX = True
 
 # 是否保留三级标题
 REMAIN_THIRD_TITLE = True
+# 优先使用pdf自带的书签（大纲）生成目录，校验不通过时再逐字符分析
+USE_OUTLINE = True
+# 遇到参考文献、致谢等结尾章节后，只检查是否有新文章标题，不再逐字符分析
+SKIP_TRAILING_SECTIONS = False
+# 分段前按字体、字号及页眉预先过滤字符，只分析可能是标题的文本
+PRE_FILTER_CHARS = True
+# 生成目录时同时按标题导出正文，每节一行写入SECTION_PATH下的jsonl；开启后不使用书签及预过滤
+EXPORT_SECTIONS = False
+SECTION_PATH = 'files/sections'
+# 跨文档的页面缓存：与已处理过的页面相同（广告、通知、目录页模板）时直接复用结果；多机处理时各节点应使用本地路径。
+# 每页都需用fitz计算指纹（含图片数据）并读写一次缓存：提取图表时可省去渲染、表格检测，默认开启；
+# 生成目录时只省去pdfplumber的字符解析，只有重复页面很多时才更快，默认不开启，
+# 可对比toc事件中的cached_pages、cache_seconds决定
+USE_PAGE_CACHE = True
+TOC_PAGE_CACHE = False
+PAGE_CACHE_PATH = 'files/page_cache.db'
 
 # 以下为保存图像配置
 # pdf缩放倍率
 ZOOM_FACTOR = 3
+# 一页中所有截图面积之和与页面面积之比不小于此值时，整页只渲染一次，再从中截取各图
+RENDER_PAGE_RATIO = 0.5
 # 表头高度，用于屏蔽表头
 HEADER_HEIGHT = 60
 # 图表下标字体高度,用于搜索下标
@@ -17,5 +44,79 @@ SUBSCRIPT_HEIGHT = 22
 EXCLUDED_NAMES = ['参考文献', 'CCF', '特邀专栏作家']
 # 同一页面两表的间隔
 TABLE_GAP = 50
-# 提取出的图表存放位置
-IMAGE_SAVE_PATH = 'files/images/{}'.format(ARTICLE_PATH.split('/')[-1])
+# 表格检测方法：pdfplumber为find_tables；ruling只根据表格线计算表格区域，速度快得多，可用`python tables.py`对比
+TABLE_DETECTOR = 'pdfplumber'
+# 将间隔不超过TABLE_GAP的矩形、曲线、图片先聚为一个图表区域，再做过滤、截图。
+# 碎片多的矢量图只截一张，但整页宽的装饰框、分隔线会把相邻的图表并为一张，截图结果与逐类合并不同，默认不开启
+CLUSTER_BOXES = False
+
+# 以下为批处理配置
+# 文档清单（标题、水印、页数）位置；批处理时是否以清单作为任务列表，并直接使用其中的标题
+CATALOG_PATH = 'files/catalog.csv'
+USE_CATALOG = False
+# 并行处理的进程数
+WORKERS = 4
+# 单篇文档的处理时限（秒），超时的进程会被结束
+DOC_TIMEOUT = 600
+# 单页的处理时限（秒），超过后该页不再检测表格
+PAGE_BUDGET = 30
+# 单页矩形、线条、曲线总数超过此值时不检测表格
+MAX_PAGE_OBJECTS = 20000
+# 超时、进程崩溃后的重试次数，仍失败的文档记入隔离列表
+MAX_RETRIES = 1
+QUARANTINE_PATH = 'files/quarantine.jsonl'
+# 多机分布式处理时，存放任务租约、完成标记的共享目录，及租约有效期（秒）
+JOB_PATH = 'files/jobs'
+LEASE_TTL = 300
+# 运行指标（Prometheus文本格式）的存放目录，为空时不导出；写入间隔（秒）；本机HTTP端口，为0时不提供，多节点时各节点依次使用其后的端口
+METRICS_PATH = 'files/metrics'
+METRICS_INTERVAL = 10
+METRICS_PORT = 0
+# fitz全局对象缓存的上限（字节），每篇文档处理后释放超出部分；每处理SHRINK_EVERY篇文档全部释放一次；新版PyMuPDF无法获得缓存大小，只按SHRINK_EVERY全部释放
+FITZ_STORE_MAXSIZE = 128 * 1024 * 1024
+SHRINK_EVERY = 20
+# 每处理SNAPSHOT_EVERY篇文档记录一次内存快照（memory_snapshot事件），为0时不记录；
+# TRACEMALLOC_FRAMES大于0时用tracemalloc同时记录增长最多的分配位置，会降低处理速度
+SNAPSHOT_EVERY = 50
+TRACEMALLOC_FRAMES = 0
+# 批处理子进程处理WORKER_MAX_DOCS篇文档或常驻内存超过WORKER_MAX_RSS（字节）后退出并重启，为0时不限制
+WORKER_MAX_DOCS = 200
+WORKER_MAX_RSS = 2 * 1024 * 1024 * 1024
+# 提取出的图表存放位置，每期单独一个目录
+IMAGE_PATH = 'files/images'
+# 整个批次内重复的图片（如logo、专栏作者照片）只保存一次，其余记录为引用
+DEDUP_IMAGES = True
+IMAGE_STORE_PATH = 'files/images/image_store.db'
+
+
+class Config(object):
+    """
+    运行配置，默认值为本模块中的同名大写常量，可按需覆盖后传给各处理类，
+    如：Config(article_path='files/test_pdfs', zoom_factor=2)
+    """
+
+    def __init__(self, **kwargs):
+        for name, value in globals().items():
+            if name.isupper():
+                setattr(self, name.lower(), value)
+
+        for k, v in kwargs.items():
+            if not hasattr(self, k):
+                raise AttributeError('未知的配置项：{}'.format(k))
+            setattr(self, k, v)
+
+    def relative_dir(self, path) -> str:
+        """
+        pdf所在目录相对`ARTICLE_PATH`的子目录，结果按此分目录保存，避免不同期中的同名文件互相覆盖
+        :param path: pdf路径
+        :return: 不在`ARTICLE_PATH`的子目录中时为空
+        """
+        rel = os.path.relpath(os.path.dirname(os.path.abspath(path)), os.path.abspath(self.article_path))
+        if rel == '.' or rel == '..' or rel.startswith('..' + os.sep):
+            return ''
+
+        return rel
+
+    @property
+    def image_save_path(self):
+        return '/'.join([self.image_path, self.article_path.rstrip('/').split('/')[-1]])
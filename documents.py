@@ -0,0 +1,50 @@
+"""
+pdf读取：文件只读取一次，pdfplumber与fitz共用同一份数据。
+除文件路径外，也可直接传入bytes或可读的流（如压缩包、消息队列中的文件），不需要落地为临时文件
+"""
+import io
+import os
+import time
+
+from log import log_event
+
+
+def read_pdf(source, name=None):
+    """
+    读取pdf数据
+    :param source: 文件路径、bytes或有read方法的流
+    :param name: 文档名，用于日志及提取标题，传入路径时默认为路径本身
+    :return: (数据, 文档名)
+    """
+    start = time.time()
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = bytes(source)
+    elif hasattr(source, 'read'):
+        data = source.read()
+        name = name or getattr(source, 'name', None)
+    else:
+        with open(source, 'rb') as f:
+            data = f.read()
+        name = name or source
+
+    if not name:
+        name = 'stream-{}.pdf'.format(id(data))
+
+    log_event('document_read', path=name, bytes=len(data), seconds=round(time.time() - start, 4))
+
+    return data, os.fspath(name)
+
+
+def open_plumber(data: bytes):
+    """以内存中的数据打开pdfplumber文档"""
+    import pdfplumber
+
+    return pdfplumber.open(io.BytesIO(data))
+
+
+def open_fitz(data: bytes):
+    """以内存中的数据打开fitz文档，与pdfplumber共用同一份数据"""
+    import fitz
+
+    return fitz.Document(stream=data, filetype='pdf')
@@ -1,27 +1,25 @@
 import functools
 import os
 import re
+import time
 import traceback
-from typing import List, Tuple, Dict
-
-import fitz
-import pdfplumber
-
-from config import (
-    ZOOM_FACTOR,
-    IMAGE_SAVE_PATH,
-    ARTICLE_PATH,
-    HEADER_HEIGHT,
-    SUBSCRIPT_HEIGHT,
-    EXCLUDED_NAMES
-)
-from pdfplumber.page import Page
+from typing import List, Tuple, Dict, TYPE_CHECKING
+
+# TITLE_COMPILE在此保留导出，供test.py使用
+from catalog import TITLE_COMPILE, get_title, title_from_path, resolve_title
+from cluster import cluster_boxes
+from config import Config
+from documents import read_pdf, open_plumber, open_fitz
+from image_store import ImageStore, digest, pixel_digest
 from exclusions import Title
-from log import get_logger
+from log import get_logger, log_event
+from page_cache import PageCache, get_kind, page_fingerprint
+from tables import find_table_boxes
 from itertools import groupby
 
-if not os.path.exists(IMAGE_SAVE_PATH):
-    os.makedirs(IMAGE_SAVE_PATH)
+# 解析库只在处理文档时导入，导入本模块不需要fitz、pdfplumber
+if TYPE_CHECKING:
+    from pdfplumber.page import Page
 
 logger = get_logger('get_images')
 error_logger = get_logger('get_images_error')
@@ -30,7 +28,6 @@ SUBSCRIPT_COMPILE = re.compile(r'([图表]\d{1,3}.*)')
 PAGE_NO_COMPILE = re.compile(r'^(\d*)$')
 REFERENCE_COMPILE = re.compile(r'(\[\d.*][\u4e00-\u9fa5a-zA-Z]+)')
 BLANK_COMPILE = re.compile(r'\s+')
-TITLE_COMPILE = re.compile(r'(第\d+期\s.*?.*?)\.pdf')
 
 Coordinates = Tuple[float, float, float, float]
 
@@ -38,18 +35,27 @@ Coordinates = Tuple[float, float, float, float]
 def after_save(func):
     @functools.wraps(func)
     def inner(*args, **kwargs):
+        self = args[0]
+        status, start = 'ok', time.time()
         try:
             return func(*args, **kwargs)
         except AssertionError:
+            status = 'read_error'
             error_logger.error('pdf读取失败： {}'.format(args[0].pdf_path))
         except Exception as e:
+            status = 'error'
             error_logger.error('pdf解析出错： %s', args[0].pdf_path)
             error_logger.error(str(e))
             error_logger.error(traceback.format_exc())
         finally:
-            self = args[0]
             self.text_doc.close()
             self.image_doc.close()
+            if self._image_store is not None:
+                self._image_store.close()
+            if self._page_cache is not None:
+                self._page_cache.close()
+            self.stats['status'] = status
+            log_event('document', path=self.pdf_path, seconds=round(time.time() - start, 3), **self.stats)
             logger.info('{} 完成！\n'.format(self.pdf_path))
 
     return inner
@@ -60,20 +66,62 @@ def _int(v):
 
 
 class TextClassifier(object):
-    def __init__(self, pdf_path):
+    def __init__(self, source, config: Config = None, name=None):
+        """
+        :param source: pdf路径、bytes或可读的流
+        :param config: 运行配置
+        :param name: 文档名，`source`不是路径时用于提取标题
+        """
+        self.config = config or Config()
+        # 文件只读取一次，两个解析库共用
+        data, self.pdf_path = read_pdf(source, name)
         # 用于解析文本、图表坐标的pdf对象, 页码从1开始
-        self.text_doc = pdfplumber.open(pdf_path)
+        self.text_doc = open_plumber(data)
         # 用于截图的pdf对象，页码从0开始
-        self.image_doc = fitz.Document(pdf_path)
-        self.pdf_path = pdf_path
+        self.image_doc = open_fitz(data)
         self.cur_page_img_dict = dict()
         self.cur_page_img_no = 0
+        # 当前页中嵌入图片的原始数据摘要，键为取整后的坐标
+        self.cur_page_digests = dict()
+        # 当前页保存或引用的图表：(下标名称，无下标时为空, 坐标, 文件路径)，用于写入页面缓存
+        self.cur_page_figures = []
+        self._image_store = None
+        self._page_cache = None
+        # 单篇文档的处理统计
+        self.stats = dict(pages=0, images=0, deleted=0, references=0, degraded_pages=0, cached_pages=0)
+        # 各阶段耗时（秒）
+        self.stats['stages'] = dict(tables=0, render=0, cache=0)
+
+        # 使用文档清单时直接取清单中的标题，不再解析第一页字符
+        title = get_title(self.config, self.pdf_path) if self.config.use_catalog else None
+        # 保存第一张图片时才创建目录
+        # 子目录中的pdf按子目录分开保存，不同期中的同名文章不会互相覆盖
+        self.save_path = os.path.join(
+            self.config.image_save_path, self.config.relative_dir(self.pdf_path), title or self.title
+        )
+
+    @property
+    def image_store(self):
+        if self._image_store is None and self.config.dedup_images:
+            self._image_store = ImageStore(self.config.image_store_path)
+
+        return self._image_store
+
+    @property
+    def page_cache(self):
+        if self._page_cache is None and self.config.use_page_cache:
+            self._page_cache = PageCache(self.config.page_cache_path)
 
-        path = os.path.join(IMAGE_SAVE_PATH, self.title)
-        if not os.path.exists(path):
-            os.makedirs(path)
+        return self._page_cache
 
-        self.save_path = path
+    @property
+    def cache_kind(self):
+        """影响图表区域及名称的配置项"""
+        c = self.config
+        return get_kind(
+            'figures', c.header_height, c.subscript_height, c.excluded_names, c.table_gap, c.cluster_boxes,
+            c.table_detector
+        )
 
     @property
     def text_pages(self):
@@ -81,11 +129,7 @@ class TextClassifier(object):
 
     @property
     def title_from_path(self):
-        res = TITLE_COMPILE.search(self.pdf_path)
-        if res and res[1]:
-            return res[1]
-
-        return self.pdf_path.split('/')[-1].strip('.pdf')
+        return title_from_path(self.pdf_path)
 
     @property
     def title(self) -> str:
@@ -93,29 +137,24 @@ class TextClassifier(object):
         获取文章标题
         :return:
         """
-        title = self.title_from_path
         tmp_title = ''
         pages = self.text_pages
-        if not pages:
-            return title
 
         try:
-            for c in pages[0].chars:
+            for c in pages[0].chars if pages else []:
                 if c['text'].startswith('(cid'):
-                    return '水印-{}'.format(title)
+                    break
                 if c['size'] >= Title.size:
                     tmp_title += c['text']
         finally:
-            return title if title else tmp_title
+            return resolve_title(self.pdf_path, tmp_title)
 
-    @staticmethod
-    def is_header(y1):
+    def is_header(self, y1):
         """是否为页眉"""
-        return True if y1 <= HEADER_HEIGHT else False
+        return True if y1 <= self.config.header_height else False
 
-    @staticmethod
-    def is_footer(h, y0):
-        return True if h - y0 <= HEADER_HEIGHT else False
+    def is_footer(self, h, y0):
+        return True if h - y0 <= self.config.header_height else False
 
     @staticmethod
     def is_references(text) -> bool:
@@ -187,8 +226,9 @@ class TextClassifier(object):
 
         page_obj = self.text_pages[page_no]
         x0, y0, x1, y1 = coordinates
-        c1 = (x0 - 5, y0 - SUBSCRIPT_HEIGHT, x1 + 5, y0)
-        c2 = (x0 - 5, y1, x1 + 5, y1 + SUBSCRIPT_HEIGHT)
+        subscript_height = self.config.subscript_height
+        c1 = (x0 - 5, y0 - subscript_height, x1 + 5, y0)
+        c2 = (x0 - 5, y1, x1 + 5, y1 + subscript_height)
 
         c1_names, c2_names = get_name_in_box(c1), get_name_in_box(c2)
         if not c1_names and not c2_names:
@@ -224,6 +264,86 @@ class TextClassifier(object):
     def get_area(self, cds):
         return (cds[2] - cds[0]) * (cds[3] - cds[1])
 
+    @staticmethod
+    def round_box(cds):
+        return tuple(int(round(v)) for v in cds)
+
+    def set_page_digests(self, images: List[Dict]):
+        """
+        计算当前页嵌入图片的原始数据摘要，用于渲染前判断图片是否已保存过
+        :param images: pdfplumber页对象的images
+        :return:
+        """
+        self.cur_page_digests = dict()
+        if self.image_store is None:
+            return
+
+        for img in images:
+            try:
+                data = img['stream'].get_rawdata()
+            except Exception:
+                continue
+
+            if data:
+                cds = (img['x0'], img['top'], img['x1'], img['bottom'])
+                self.cur_page_digests[self.round_box(cds)] = digest(data)
+
+    def find_saved(self, path):
+        """
+        去重索引中记录的文件：文件已被删除（如清空结果目录后重跑）时移除其记录，返回None以重新截图
+        :param path: `find_digest`或`find_render`返回的路径
+        :return:
+        """
+        if path is None or os.path.exists(path):
+            return path
+
+        self.image_store.remove_path(path)
+        logger.debug('%s 已不存在，重新保存', path)
+        return None
+
+    def add_reference(self, pic_name, path, key=''):
+        self.image_store.add_reference(self.pdf_path, pic_name, path, key)
+        self.stats['references'] += 1
+        logger.debug('%s --- 与 %s 重复', pic_name, path)
+
+    def render_whole_page(self, page, coordinates_list: List[Coordinates]) -> bool:
+        """
+        截图较多、面积较大时，整页渲染一次比逐个区域渲染更快
+        :param page: fitz页对象
+        :param coordinates_list: 待截图的坐标
+        :return:
+        """
+        import fitz
+
+        if len(coordinates_list) < 2:
+            return False
+
+        page_rect = page.rect
+        total = sum([(fitz.Rect(*c) & page_rect).get_area() for c in coordinates_list])
+
+        return total >= page_rect.get_area() * self.config.render_page_ratio
+
+    @staticmethod
+    def crop_pixmap(page, page_pix, clip, mat):
+        """
+        从整页渲染结果中截取区域，尺寸与`page.get_pixmap(matrix=mat, clip=clip)`一致。
+        图片、文字及水平竖直的线条逐像素相同；斜线按区域渲染时抗锯齿略有差异，截图的`pixel_digest`可能不同
+        :param page: fitz页对象
+        :param page_pix: 整页渲染结果
+        :param clip: 截取区域，页面坐标
+        :param mat: 缩放矩阵
+        :return:
+        """
+        import fitz
+
+        irect = ((page.rect & clip) * mat).irect
+        if irect.is_empty:
+            return page.get_pixmap(matrix=mat, alpha=False, clip=clip)
+
+        pix = fitz.Pixmap(page_pix.colorspace, irect, False)
+        pix.copy(page_pix, irect)
+        return pix
+
     def save_page_objects(self, page, coordinates_list: List[Coordinates]):
         """
         根据坐标保存每页的所有对象
@@ -232,11 +352,16 @@ class TextClassifier(object):
         :param coordinates_list:
         :return:
         """
-        mat = fitz.Matrix(ZOOM_FACTOR, ZOOM_FACTOR)
+        import fitz
+
+        mat = fitz.Matrix(self.config.zoom_factor, self.config.zoom_factor)
+        # 整页渲染结果，需要时才渲染
+        whole_page, page_pix = self.render_whole_page(page, coordinates_list), None
 
         for c in coordinates_list:
             # 提取图片下标，如果获取不到用页码+数字取名
             pic_name = self.get_subscript(page.number, c)
+            subscript = pic_name
 
             if pic_name in self.cur_page_img_dict:
                 if self.get_area(c) < self.get_area(self.cur_page_img_dict[pic_name]):
@@ -245,18 +370,82 @@ class TextClassifier(object):
             if not pic_name:
                 pic_name = 'page_{}_{}'.format(page.number, self.cur_page_img_no)
 
+            # 嵌入图片已保存过时，不再渲染
+            key = self.cur_page_digests.get(self.round_box(c))
+            if key is not None:
+                path = self.find_saved(self.image_store.find_digest(key))
+                if path is not None:
+                    self.add_reference(pic_name, path, key)
+                    self.cur_page_figures.append((subscript, c, path))
+                    continue
+
             clip = fitz.Rect(*c)
-            pix = page.get_pixmap(matrix=mat, alpha=False, clip=clip)
+            render_start = time.time()
+            if whole_page:
+                if page_pix is None:
+                    page_pix = page.get_pixmap(matrix=mat, alpha=False)
+                pix = self.crop_pixmap(page, page_pix, clip, mat)
+            else:
+                pix = page.get_pixmap(matrix=mat, alpha=False, clip=clip)
+            self.stats['stages']['render'] += time.time() - render_start
+
+            render_key = None
+            if self.image_store is not None:
+                render_key = pixel_digest(pix)
+                path = self.find_saved(self.image_store.find_render(render_key))
+                if path is not None:
+                    self.add_reference(pic_name, path, render_key)
+                    self.cur_page_figures.append((subscript, c, path))
+                    continue
 
             try:
-                pix.save('{}/{}.png'.format(self.save_path, pic_name))
+                if not os.path.exists(self.save_path):
+                    os.makedirs(self.save_path)
+                fpath = '{}/{}.png'.format(self.save_path, pic_name)
+                pix.save(fpath)
                 self.cur_page_img_dict[pic_name] = c
                 self.cur_page_img_no += 1
+                self.stats['images'] += 1
             except RuntimeError:
                 error_logger.error('{}: {} 错误, 保存对象失败！'.format(self.pdf_path, c))
                 continue
 
-            logger.info('%s --- 保存成功！' % pic_name)
+            if self.image_store is not None:
+                self.image_store.add(fpath, key, render_key, pix.width, pix.height)
+
+            self.cur_page_figures.append((subscript, c, fpath))
+            logger.debug('%s --- 保存成功！', pic_name)
+
+    def replay_page_objects(self, page, figures: List):
+        """
+        按页面缓存中的图表区域及名称保存：文件仍存在且开启了去重时只记录引用，否则重新截图
+        :param page: fitz页对象
+        :param figures: 缓存的[下标名称, 坐标, 文件路径]列表
+        :return:
+        """
+        import fitz
+
+        mat = fitz.Matrix(self.config.zoom_factor, self.config.zoom_factor)
+
+        for subscript, c, path in figures:
+            pic_name = subscript or 'page_{}_{}'.format(page.number, self.cur_page_img_no)
+            self.cur_page_img_no += 1
+
+            if self.image_store is not None and os.path.exists(path):
+                self.add_reference(pic_name, path, 'page')
+                continue
+
+            render_start = time.time()
+            pix = page.get_pixmap(matrix=mat, alpha=False, clip=fitz.Rect(*c))
+            self.stats['stages']['render'] += time.time() - render_start
+
+            if not os.path.exists(self.save_path):
+                os.makedirs(self.save_path)
+            fpath = '{}/{}.png'.format(self.save_path, pic_name)
+            pix.save(fpath)
+            self.stats['images'] += 1
+            if self.image_store is not None:
+                self.image_store.add(fpath, width=pix.width, height=pix.height)
 
     @staticmethod
     def merge_box(c1, c2):
@@ -366,7 +555,10 @@ class TextClassifier(object):
 
                     self.cur_page_img_dict.pop(name)
                     os.remove(fpath)
-                    logger.info('删除 {}'.format(fpath))
+                    if self.image_store is not None:
+                        self.image_store.remove_path(fpath)
+                    self.stats['deleted'] += 1
+                    logger.debug('删除 %s', fpath)
 
         self.cur_page_img_dict = {}
         self.cur_page_img_no = 0
@@ -388,15 +580,34 @@ class TextClassifier(object):
         return False
 
     def in_keywords(self, text):
-        for k in EXCLUDED_NAMES:
+        for k in self.config.excluded_names:
             if k in text:
                 return True
 
         return False
 
-    def filter(self, text_page: Page, coordinates_list: List[Coordinates]):
+    def is_valid_box(self, text_page: 'Page', c: Coordinates, check_size=True) -> bool:
         """
-        过滤不合法的坐标：1、包含负数 2、页眉 3、页码（页脚）
+        只根据坐标判断是否合法：1、包含负数（或宽、高过小） 2、页眉 3、页码（页脚）
+        :param check_size: 是否屏蔽宽、高过小的区域，聚类前的细线、刻度等不检查
+        """
+        # 屏蔽包含负数的坐标
+        if min(c) < 0 or (check_size and self.has_negative_coordinates(c)):
+            return False
+
+        # 屏蔽页眉
+        if self.is_header(c[3]):
+            return False
+
+        # 屏蔽页脚
+        if self.is_footer(text_page.height, c[1]):
+            return False
+
+        return True
+
+    def filter(self, text_page: 'Page', coordinates_list: List[Coordinates]):
+        """
+        过滤不合法的坐标：1、包含负数 2、页眉 3、页码（页脚） 4、关键词 5、参考文献
         :param text_page: pdf页码，从0开始
         :param coordinates_list: 坐标列表
         :return: 合法的坐标列表
@@ -404,17 +615,7 @@ class TextClassifier(object):
         ret = list()
 
         for c in coordinates_list:
-
-            # 屏蔽包含负数的坐标
-            if self.has_negative_coordinates(c):
-                continue
-
-            # 屏蔽页眉
-            if self.is_header(c[3]):
-                continue
-
-            # 屏蔽页脚
-            if self.is_footer(text_page.height, c[1]):
+            if not self.is_valid_box(text_page, c):
                 continue
 
             chars = self.get_text_in_box(text_page.page_number - 1, c)
@@ -435,24 +636,120 @@ class TextClassifier(object):
         box_list = self.get_the_same_objects(image_page.number, obj_cds)
         self.save_page_objects(image_page, box_list)
 
+    @staticmethod
+    def get_subscript_boxes(text_page: 'Page') -> List[Coordinates]:
+        """
+        获取页面中所有图表下标（“图1”、“表2”等）开头两个字符的坐标
+        :param text_page: pdfplumber页对象
+        :return:
+        """
+        ret = []
+        chars = text_page.chars
+
+        for c1, c2 in zip(chars, chars[1:]):
+            if c1['text'] in ('图', '表') and c2['text'].isdigit():
+                ret.append((
+                    min(c1['x0'], c2['x0']), min(c1['top'], c2['top']),
+                    max(c1['x1'], c2['x1']), max(c1['bottom'], c2['bottom'])
+                ))
+
+        return ret
+
+    def save_by_clusters(self, text_page, image_page, obj_cds):
+        """
+        先将相距不超过`TABLE_GAP`的对象聚为图表区域，再逐个区域过滤、截图。
+        与`merge_boxs`一样，合并后包含图表下标的区域不合并。
+        细条、刻度线等宽或高很小的对象需要参与聚类，尺寸只对聚类后的区域检查
+        """
+        obj_cds = [c for c in obj_cds if self.is_valid_box(text_page, c, check_size=False)]
+        if not obj_cds:
+            return
+
+        subscript_boxes = self.get_subscript_boxes(text_page)
+
+        def has_subscript(box):
+            box = (box[0] - 5, box[1], box[2] + 5, box[3])
+            for sub_box in subscript_boxes:
+                if self.in_or_cross_box(box, sub_box):
+                    return True
+            return False
+
+        box_list = cluster_boxes(obj_cds, self.config.table_gap, has_subscript)
+        self.save_page_objects(image_page, self.filter(text_page, box_list))
+
+    def is_over_budget(self, text_page: 'Page', start) -> bool:
+        """
+        页面是否过于复杂、耗时过长，此时跳过表格检测
+        :param text_page: pdfplumber页对象
+        :param start: 本页开始处理的时间
+        :return:
+        """
+        if time.time() - start > self.config.page_budget:
+            return True
+
+        count = len(text_page.rects) + len(text_page.lines) + len(text_page.curves)
+        return count > self.config.max_page_objects
+
     @after_save
     def save(self):
         for text_page in self.text_pages:
+            start = time.time()
             # 用以截图的pdf页对象
             page_no = text_page.page_number - 1
             image_page = self.image_doc.load_page(page_no)
+            self.stats['pages'] += 1
+
+            # 与已处理过的页面相同时，复用其结果
+            cache_key = None
+            if self.page_cache is not None:
+                cache_start = time.time()
+                cache_key = page_fingerprint(image_page)
+                figures = self.page_cache.get(cache_key, self.cache_kind)
+                self.stats['stages']['cache'] += time.time() - cache_start
+                if figures is not None:
+                    self.replay_page_objects(image_page, figures)
+                    self.stats['cached_pages'] += 1
+                    self.cur_page_img_no = 0
+                    continue
+
+            self.set_page_digests(text_page.images)
+            self.cur_page_figures = []
 
             # 保存矩形
-            for items in [text_page.images, text_page.rects]:
-                obj_cds = [(img['x0'], img['top'], img['x1'], img['bottom']) for img in items]
+            if self.config.cluster_boxes:
+                obj_cds = [
+                    (img['x0'], img['top'], img['x1'], img['bottom'])
+                    for items in [text_page.images, text_page.rects, text_page.curves] for img in items
+                ]
+                self.save_by_clusters(text_page, image_page, obj_cds)
+            else:
+                for items in [text_page.images, text_page.rects]:
+                    obj_cds = [(img['x0'], img['top'], img['x1'], img['bottom']) for img in items]
+                    self.save_by_cds(text_page, image_page, obj_cds)
+
+            degraded = self.is_over_budget(text_page, start)
+            if degraded:
+                self.stats['degraded_pages'] += 1
+                logger.info('%s 第%s页过于复杂，跳过表格检测', self.pdf_path, text_page.page_number)
+            else:
+                tables_start = time.time()
+                if self.config.table_detector == 'ruling':
+                    obj_cds = find_table_boxes(text_page)
+                else:
+                    obj_cds = [img.bbox for img in text_page.find_tables()]
+                self.stats['stages']['tables'] += time.time() - tables_start
                 self.save_by_cds(text_page, image_page, obj_cds)
 
-            obj_cds = [img.bbox for img in text_page.find_tables()]
-            self.save_by_cds(text_page, image_page, obj_cds)
-
             # 在本页中去重
             self.de_duplication()
 
+            # 跳过表格检测的页面结果不完整，不写入缓存
+            if cache_key is not None and not degraded:
+                cache_start = time.time()
+                figures = [list(item) for item in self.cur_page_figures if os.path.exists(item[2])]
+                self.page_cache.put(cache_key, self.cache_kind, figures)
+                self.stats['stages']['cache'] += time.time() - cache_start
+
 
 def test():
     file_name = '第3期 交互式搜索意图理解：超越传统搜索的信息发现.pdf'
@@ -474,21 +771,32 @@ def test():
     file_name = '第12期 做顶天立地的研究培养独立的学术风格——访“2017CCF王选奖”获得者鲍虎军教授.pdf'
     file_name = '第1期 提高健康、安全和生活质量的模式识别.pdf'
     file_name = '第10期 云计算与虚拟化.pdf'
-    fpath = ARTICLE_PATH + '/' + file_name
+    fpath = Config().article_path + '/' + file_name
     obj = TextClassifier(fpath)
     obj.save()
 
 
-def run():
-    res = dict()
-    for file_name in os.listdir(ARTICLE_PATH):
+def run(config: Config = None):
+    summary = dict(documents=0, pages=0, images=0, errors=0)
+    start = time.time()
+
+    config = config or Config()
+
+    for file_name in os.listdir(config.article_path):
         if not file_name.endswith('.pdf'):
             continue
 
-        fpath = ARTICLE_PATH + '/' + file_name
-        obj = TextClassifier(fpath)
+        fpath = config.article_path + '/' + file_name
+        obj = TextClassifier(fpath, config)
         obj.save()
 
+        summary['documents'] += 1
+        summary['pages'] += obj.stats['pages']
+        summary['images'] += obj.stats['images'] - obj.stats['deleted']
+        summary['errors'] += obj.stats['status'] != 'ok'
+
+    log_event('batch', path=config.article_path, seconds=round(time.time() - start, 3), **summary)
+
 
 if __name__ == '__main__':
     # test()
@@ -1,17 +1,26 @@
 import os
+import re
+import time
 import traceback
-from typing import List, Dict
-
-import pdfplumber
-
-from config import RESULT_PATH, ARTICLE_PATH
-from exclusions import Title, PrimaryTitle, SecondaryTitle, ThirdLevelTitle
-from log import get_logger
+from typing import List, Dict, Optional
+
+from config import Config
+from documents import read_pdf, open_plumber, open_fitz
+from exclusions import (
+    Title,
+    PrimaryTitle,
+    SecondaryTitle,
+    ThirdLevelTitle,
+    OTHER_WORDS,
+    EXCLUDED_WORDS,
+    EXCLUDED_FONTS,
+    FONT_COMPILE
+)
+from log import get_logger, log_event
+from page_cache import PageCache, get_kind, page_fingerprint
+from sections import SectionWriter
 from tree import Tree, Node
 
-if not os.path.exists(RESULT_PATH):
-    os.makedirs(RESULT_PATH)
-
 __KEYS__ = [
     'matrix',  # 此字符的“当前转换矩阵”。
     'fontname',  # 字符的字体。
@@ -36,23 +45,138 @@ __KEYS__ = [
 
 log = get_logger(__name__)
 
+BLANK_COMPILE = re.compile(r'\s+')
+
+# 书签与页面文本匹配：书签标题的最短长度；文本段短于书签标题时，长度至少为标题的此比例
+OUTLINE_MIN_LENGTH = 2
+OUTLINE_MATCH_RATIO = 0.8
+
+# 页面缓存中保存的字符属性
+CACHED_CHAR_KEYS = ('text', 'size', 'fontname', 'x0', 'x1', 'top', 'bottom')
+
+
+def get_title_level(size) -> Optional[int]:
+    """
+    根据字号获取标题层级
+    :param size: 取整后的字号
+    :return: 标题层级，非标题字号返回None
+    """
+    if size >= Title.size:
+        return Title.level
+
+    for title_cls in (PrimaryTitle, SecondaryTitle, ThirdLevelTitle):
+        if size == title_cls.size:
+            return title_cls.level
+
+    return None
+
+
+class CharFilter(object):
+    """
+    字符预过滤，规则来自exclusions.py，只保留可能是标题的字符：
+    1、字号不小于三级标题 2、所在文本段不以页眉开始 3、字体不在`EXCLUDED_FONTS`中。
+    页眉按同一字号的连续文本段判断，与`handle_text`一致；逐字符分析本身不屏蔽页脚，这里也不屏蔽，
+    因此除排除的字体、词语外，预过滤不改变目录结果
+    """
+
+    def __init__(self, min_size=ThirdLevelTitle.size, band_height=55):
+        # 取整后不小于`min_size`
+        self.min_size = min_size - 0.5
+        self.band_height = band_height
+        self.excluded_fonts = frozenset(EXCLUDED_FONTS)
+        self.excluded_words = tuple(EXCLUDED_WORDS)
+        self.font_cache = dict()
+
+    def is_excluded_font(self, fontname: str) -> bool:
+        if fontname not in self.font_cache:
+            m = FONT_COMPILE.search(fontname)
+            self.font_cache[fontname] = bool(m) and m[1] in self.excluded_fonts
+
+        return self.font_cache[fontname]
+
+    def has_excluded_word(self, text: str) -> bool:
+        for w in self.excluded_words:
+            if w in text:
+                return True
+
+        return False
+
+    def split(self, chars: List[Dict]) -> List[List[Dict]]:
+        """
+        一次遍历过滤字符，返回保留下来的字符片段。
+        被多个字符隔开的字符分属不同片段，保证原本不相邻的同字号标题不会被合并
+
+        :param chars: 页面字符
+        :return:
+        """
+        segments, cur, dropped = [], [], 0
+        # 当前同一字号文本段的字号，及其第一个字符是否在页眉内
+        run_size, in_header = None, False
+
+        for c in chars:
+            if c['size'] != run_size:
+                run_size, in_header = c['size'], c['bottom'] <= self.band_height
+
+            if c['size'] >= self.min_size and not in_header and not self.is_excluded_font(c['fontname']):
+                if dropped > 1 and cur:
+                    segments.append(cur)
+                    cur = []
+
+                cur.append(c)
+                dropped = 0
+            else:
+                dropped += 1
+
+        if cur:
+            segments.append(cur)
+
+        return segments
+
 
 class TextClassifier(object):
-    def __init__(self, pdf_path):
-        # pdf对象
-        self.pdf = pdfplumber.open(pdf_path)
+    def __init__(self, source, config: Config = None, name=None):
+        """
+        :param source: pdf路径、bytes或可读的流
+        :param config: 运行配置
+        :param name: 文档名，`source`不是路径时使用
+        """
+        self.config = config or Config()
+        # 文件只读取一次，书签、逐字符分析共用
+        self.data, self.pdf_path = read_pdf(source, name)
+        # pdf对象，逐字符分析时才打开
+        self._pdf = None
         # 存放目录的树
         self.tree = Tree(Node())
         self.pre_node = None
         self.last_count = -1
         self.level_set = set()
+        self.char_filter = CharFilter()
+        # 页面缓存的命中页数及计算指纹、读写缓存的耗时（秒）
+        self.cache_stats = dict(cached_pages=0, cache_seconds=0)
+
+    @property
+    def pdf(self):
+        if self._pdf is None:
+            self._pdf = open_plumber(self.data)
+
+        return self._pdf
+
+    @property
+    def name(self):
+        return os.path.basename(self.pdf_path)[:-len('.pdf')]
+
+    @property
+    def relative_dir(self):
+        """pdf相对`ARTICLE_PATH`的子目录"""
+        return self.config.relative_dir(self.pdf_path)
 
     @staticmethod
-    def iter_successive_text(chars: List[Dict]) -> str:
+    def iter_successive_text(chars: List[Dict], min_length=2) -> str:
         """
         获取连续的、同一类型的（即同一层级的）信息。
 
         :param chars: pdf中获取的元素信息列表
+        :param min_length: 短于此长度的文本不返回（页面最后一段除外），导出正文时为1
         :return:
         """
         i, j = 0, 0
@@ -65,11 +189,28 @@ class TextClassifier(object):
                     yield chars[i:j]
 
             else:
-                if j - i > 1:
+                if j - i >= min_length:
                     yield chars[i:j]
 
                 i = j
 
+    @staticmethod
+    def join_lines(chars: List[Dict], prev: Optional[Dict] = None) -> str:
+        """
+        拼接正文字符，不在同一行的字符之间加换行符
+        :param chars: 连续字符
+        :param prev: 同一页中上一段正文的最后一个字符，与`chars`不在同一行时以换行符开头
+        :return:
+        """
+        texts = []
+        for c in chars:
+            if prev is not None and abs(c['top'] - prev['top']) > min(prev['size'], c['size']) / 2:
+                texts.append('\n')
+            texts.append(c['text'])
+            prev = c
+
+        return ''.join(texts)
+
     def set_title(self, count, **kwargs):
         if self.pre_node is None:
             self.tree.update(self.tree.root, **kwargs)
@@ -179,7 +320,13 @@ class TextClassifier(object):
         else:
             self.adjust_level(count, **kwargs)
 
-    def handle_text(self, count: int, chars: List[Dict]):
+    def handle_text(self, count: int, chars: List[Dict]) -> bool:
+        """
+        按字号将文本作为相应层级的标题插入目录树
+        :param count: 文本序号
+        :param chars: 同一字号的连续字符
+        :return: 是否为标题
+        """
         size = int(round(chars[0]['size']))
 
         params = dict()
@@ -190,7 +337,7 @@ class TextClassifier(object):
 
         # 屏蔽页眉
         if params['bottom'] <= 55:
-            return
+            return False
 
         if size >= Title.size:
             params['level'] = Title.level
@@ -208,10 +355,242 @@ class TextClassifier(object):
             params['level'] = ThirdLevelTitle.level
             self.set_third_level_title(count, **params)
         else:
-            return
+            return False
 
         self.level_set.add(params['level'])
         self.last_count = count
+        return True
+
+    @staticmethod
+    def get_page_runs(page) -> List[Dict]:
+        """
+        获取页面中连续的、同一字号的文本段，页眉部分不计入
+
+        :param page: fitz页对象
+        :return:
+        """
+        runs = []
+
+        for block in page.get_text('dict')['blocks']:
+            for line in block.get('lines', []):
+                for span in line['spans']:
+                    text = re.sub(BLANK_COMPILE, '', span['text'])
+                    x0, top, x1, bottom = span['bbox']
+                    if not text or bottom <= 55:
+                        continue
+
+                    size = int(round(span['size']))
+                    if runs and runs[-1]['size'] == size:
+                        runs[-1]['text'] += text
+                        runs[-1]['bottom'] = bottom
+                        continue
+
+                    runs.append(dict(text=text, size=size, x0=x0, x1=x1, top=top, bottom=bottom))
+
+        return runs
+
+    @staticmethod
+    def match_outline_item(title: str, runs: List[Dict]) -> Optional[Dict]:
+        """
+        在页面文本段中查找与书签标题对应、且字号为标题字号的文本段：
+        文本段包含书签标题，或文本段与书签标题几乎相同（长度不小于标题的`OUTLINE_MATCH_RATIO`）
+        :param title: 书签标题
+        :param runs: 书签所指页面的文本段
+        :return:
+        """
+        title = re.sub(BLANK_COMPILE, '', title)
+        if len(title) < OUTLINE_MIN_LENGTH:
+            return None
+
+        for run in runs:
+            if get_title_level(run['size']) is None:
+                continue
+
+            text = run['text']
+            if title in text:
+                return run
+            if text in title and len(text) >= max(OUTLINE_MIN_LENGTH, len(title) * OUTLINE_MATCH_RATIO):
+                return run
+
+        return None
+
+    def classify_by_outline(self) -> bool:
+        """
+        根据pdf自带的书签生成目录树。书签只在其所指页面上校验，每一项都需找到字号相符的标题，
+        且书签层级与字号对应的层级一致（相差固定值，书签可能从文章标题或一级标题开始编号），
+        否则放弃书签，返回False
+
+        :return: 是否生成成功
+        """
+        items, page_runs, offsets = [], dict(), set()
+
+        try:
+            doc = open_fitz(self.data)
+        except Exception:
+            log.error(traceback.format_exc())
+            return False
+
+        try:
+            toc = doc.get_toc(simple=True)
+            if not toc:
+                return False
+
+            for outline_level, title, page_number in toc:
+                if not 1 <= page_number <= doc.page_count:
+                    return False
+
+                if page_number not in page_runs:
+                    page_runs[page_number] = self.get_page_runs(doc.load_page(page_number - 1))
+
+                run = self.match_outline_item(title, page_runs[page_number])
+                if run is None:
+                    log.info('书签校验失败：{} - {}'.format(self.pdf_path, title))
+                    return False
+
+                params = dict(run)
+                params['text'] = title.strip()
+                params['page_number'] = page_number
+                params['level'] = get_title_level(run['size'])
+                items.append(params)
+
+                offsets.add(outline_level - params['level'])
+                if len(offsets) > 1:
+                    log.info('书签层级与标题字号不符：{} - {}'.format(self.pdf_path, title))
+                    return False
+        except Exception:
+            log.error(traceback.format_exc())
+            return False
+        finally:
+            doc.close()
+
+        self.build_from_outline(items)
+        return True
+
+    def build_from_outline(self, items: List[Dict]):
+        """
+        按标题层级将书签插入目录树，缺失的中间层级以空结点补齐
+        :param items: 校验过的书签项
+        :return:
+        """
+        # stack[i]为当前第i层的结点，根结点为第0层
+        stack = [self.tree.root]
+
+        for params in items:
+            level = params['level']
+            if level == Title.level:
+                if not getattr(self.tree.root, 'text', ''):
+                    self.tree.update(self.tree.root, **params)
+                continue
+
+            del stack[level:]
+            while len(stack) < level:
+                node = Node(level=len(stack))
+                self.tree.insert(stack[-1], node)
+                stack.append(node)
+
+            node = Node(**params)
+            self.tree.insert(stack[-1], node)
+            stack.append(node)
+
+            self.level_set.add(level)
+
+        self.pre_node = stack[-1]
+
+    def iter_page_runs(self, page):
+        """
+        获取页面中同一字号的连续文本及其序号，开启预过滤时只返回候选标题文本，导出正文时不过滤
+
+        :param page: pdfplumber页对象
+        :return:
+        """
+        if not self.config.pre_filter_chars or self.config.export_sections:
+            yield from enumerate(self.iter_successive_text(page.chars))
+            return
+
+        count = 0
+        for segment in self.char_filter.split(page.chars):
+            for attr_list in self.iter_successive_text(segment):
+                if not self.char_filter.has_excluded_word(''.join([c['text'] for c in attr_list])):
+                    yield count, attr_list
+                count += 1
+
+            # 片段之间隔有被过滤的文本
+            count += 1
+
+    def iter_section_runs(self, page):
+        """
+        导出正文时使用：页面中同一字号的所有连续文本，单个字符的文本也作为正文返回。
+        只有`iter_successive_text`默认返回的文本参与标题判断，其序号与不导出正文时一致
+
+        :param page: pdfplumber页对象
+        :return: (序号, 字符, 是否参与标题判断)
+        """
+        runs = list(self.iter_successive_text(page.chars, min_length=1))
+
+        count = 0
+        for i, attr_list in enumerate(runs):
+            candidate = len(attr_list) > 1 or i == len(runs) - 1
+            yield count, attr_list, candidate
+            count += candidate
+
+    def iter_cached_page_runs(self, page, fitz_page, page_cache: PageCache):
+        """
+        与`iter_page_runs`相同，页面已处理过时直接返回缓存的标题文本；否则逐字符分析，并缓存标题文本
+        :param page: pdfplumber页对象
+        :param fitz_page: 同一页的fitz页对象，用于计算页面指纹
+        :param page_cache: 页面缓存
+        :return:
+        """
+        start = time.time()
+        key, kind = page_fingerprint(fitz_page), get_kind('toc', self.config.pre_filter_chars)
+        cached = page_cache.get(key, kind)
+        self.cache_stats['cache_seconds'] += time.time() - start
+
+        if cached is not None:
+            self.cache_stats['cached_pages'] += 1
+            for count, chars in cached:
+                for c in chars:
+                    c['page_number'] = page.page_number
+                yield count, chars
+            return
+
+        runs = []
+        for count, attr_list in self.iter_page_runs(page):
+            if get_title_level(int(round(attr_list[0]['size']))) is not None:
+                runs.append([count, [{k: c[k] for k in CACHED_CHAR_KEYS} for c in attr_list]])
+            yield count, attr_list
+
+        start = time.time()
+        page_cache.put(key, kind, runs)
+        self.cache_stats['cache_seconds'] += time.time() - start
+
+    @staticmethod
+    def is_trailing_section(chars: List[Dict]) -> bool:
+        """
+        是否为一级标题字号的结尾章节（参考文献、致谢等）
+        :param chars: 同一字号的连续字符
+        :return:
+        """
+        if int(round(chars[0]['size'])) != PrimaryTitle.size:
+            return False
+
+        text = re.sub(BLANK_COMPILE, '', ''.join([c['text'] for c in chars]))
+        return text in OTHER_WORDS
+
+    @staticmethod
+    def has_new_article(page) -> bool:
+        """
+        页面中是否有文章标题，只读取fitz的文本块，不做逐字符分析
+        :param page: fitz页对象
+        :return:
+        """
+        for block in page.get_text('dict')['blocks']:
+            for line in block.get('lines', []):
+                for span in line['spans']:
+                    if span['bbox'][3] > 55 and span['text'].strip() and int(round(span['size'])) >= Title.size:
+                        return True
+
+        return False
 
     def classify(self):
         """
@@ -219,21 +598,126 @@ class TextClassifier(object):
 
         :return:
         """
+        # 处于结尾章节时用于快速检查新文章标题、使用页面缓存时用于计算页面指纹的fitz文档
+        fitz_doc = None
+        in_trailing = False
+        status, source, start = 'ok', 'chars', time.time()
+
+        # 导出正文时需逐页读取所有文本，不使用书签，也不跳过结尾章节
+        sections = None
+        if self.config.export_sections:
+            fpath = os.path.join(self.config.section_path, self.relative_dir, self.name + '.jsonl')
+            sections = SectionWriter(fpath, self.tree, self.pdf_path)
+
+        # 导出正文时需要每页的全部文本，不使用页面缓存
+        page_cache = None
+        if self.config.toc_page_cache and sections is None:
+            page_cache = PageCache(self.config.page_cache_path)
+
         try:
+            if self.config.use_outline and sections is None and self.classify_by_outline():
+                source = 'outline'
+                return
+
             for page in self.pdf.pages:
-                for count, attr_list in enumerate(self.iter_successive_text(page.chars)):
+                if in_trailing:
+                    if fitz_doc is None:
+                        fitz_doc = open_fitz(self.data)
+                    if not self.has_new_article(fitz_doc.load_page(page.page_number - 1)):
+                        continue
+
+                if sections is not None:
+                    runs = self.iter_section_runs(page)
+                    # 同一页中上一段正文的最后一个字符，用于判断换行
+                    body_prev = None
+                else:
+                    runs = self.iter_page_runs(page)
+                    if page_cache is not None:
+                        if fitz_doc is None:
+                            fitz_doc = open_fitz(self.data)
+                        runs = self.iter_cached_page_runs(page, fitz_doc.load_page(page.page_number - 1), page_cache)
+                    runs = ((count, attr_list, True) for count, attr_list in runs)
+
+                for count, attr_list, candidate in runs:
 
                     size = attr_list[0]['size']
                     bottom = attr_list[0]['bottom']
+
+                    # 结尾章节中只处理文章标题
+                    if in_trailing and int(round(size)) < Title.size:
+                        continue
+
                     if size >= ThirdLevelTitle.size and bottom > 55:
-                        print(str(int(round(size))) + ' - ' + ''.join([i['text'] for i in attr_list]))
+                        log.debug('%s - %s', int(round(size)), ''.join([i['text'] for i in attr_list]))
+
+                    is_heading = candidate and self.handle_text(count, attr_list)
 
-                    self.handle_text(count, attr_list)
+                    if sections is not None:
+                        if is_heading:
+                            sections.switch(self.pre_node)
+                            body_prev = None
+                        elif bottom > 55:
+                            sections.add(self.join_lines(attr_list, body_prev), page.page_number)
+                            body_prev = attr_list[-1]
+                        continue
+
+                    if not self.config.skip_trailing_sections:
+                        continue
+
+                    if self.is_trailing_section(attr_list):
+                        in_trailing = True
+                    elif int(round(size)) >= Title.size and bottom > 55:
+                        in_trailing = False
 
         except Exception as e:
+            status = 'error'
             log.error(traceback.format_exc())
         finally:
-            self.pdf.close()
+            if self._pdf is not None:
+                self._pdf.close()
+            if fitz_doc is not None:
+                fitz_doc.close()
+            if page_cache is not None:
+                page_cache.close()
+
+            fields = dict()
+            if page_cache is not None:
+                fields['cached_pages'] = self.cache_stats['cached_pages']
+                fields['cache_seconds'] = round(self.cache_stats['cache_seconds'], 3)
+            if sections is not None:
+                sections.close(status == 'ok')
+                fields['sections'] = sections.count
+
+            log_event(
+                'toc',
+                path=self.pdf_path,
+                source=source,
+                status=status,
+                headings=len(self.tree.level_order()) - 1,
+                seconds=round(time.time() - start, 3),
+                **fields
+            )
+
+    def save(self):
+        """
+        生成目录，并按`TOC_FORMAT`格式保存到`RESULT_PATH`
+        :return: 结果文件路径
+        """
+        self.classify()
+
+        dir_name = os.path.join(self.config.result_path, self.relative_dir)
+        if not os.path.exists(dir_name):
+            os.makedirs(dir_name)
+
+        toc_format = self.config.toc_format
+        fpath = os.path.join(dir_name, '{}.{}'.format(self.name, toc_format))
+        with open(fpath, 'w', encoding='utf-8') as f:
+            if toc_format == 'jsonl':
+                self.tree.dump_jsonl(f)
+            else:
+                self.tree.dump_json(f)
+
+        return fpath
 
 
 def test():
@@ -241,14 +725,14 @@ def test():
     # file_name = '第12期 移动互联网时代的位置服务.pdf'
     file_name = '第10期 艾级计算系统若干挑战问题的思考.pdf'
     # file_name = '第10期 百毒不侵的电脑是怎样练成的.pdf'
-    obj = TextClassifier(ARTICLE_PATH + '/' + file_name)
+    obj = TextClassifier(Config().article_path + '/' + file_name)
     obj.classify()
     print([getattr(item, 'text', '') for item in obj.tree.level_order()])
     print(obj.tree.tree_dict)
 
 
 if __name__ == '__main__':
-    path = ARTICLE_PATH
+    path = Config().article_path
     # path = 'files/test_pdfs'
     # run(path)
     test()
@@ -0,0 +1,118 @@
+"""
+批次内重复图片的内容寻址存储。
+嵌入图片以原始数据的摘要为键，渲染前即可判断是否重复；矢量图、表格等渲染区域以全部像素的摘要为键。
+线框表格、图表大多为白色，感知哈希相近的不一定是同一张图，因此不做近似匹配。
+重复的图片不再保存文件，只记录对已保存文件的引用
+"""
+import hashlib
+import os
+import sqlite3
+import time
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS images (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_path ON images (path);
+CREATE TABLE IF NOT EXISTS refs (
+    document TEXT NOT NULL,
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    path TEXT NOT NULL,
+    created REAL
+);
+CREATE INDEX IF NOT EXISTS refs_path ON refs (path);
+'''
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def pixel_digest(pix) -> str:
+    """
+    渲染结果的摘要：尺寸、通道数及全部像素，只有逐像素相同的截图才视为重复
+    :param pix: fitz.Pixmap
+    :return:
+    """
+    h = hashlib.sha1('{}x{}x{}'.format(pix.width, pix.height, pix.n).encode('utf-8'))
+    h.update(pix.samples)
+    return h.hexdigest()
+
+
+class ImageStore(object):
+    def __init__(self, db_path):
+        """
+        :param db_path: 索引位置
+        """
+        dir_name = os.path.dirname(db_path)
+        if dir_name and not os.path.exists(dir_name):
+            os.makedirs(dir_name)
+
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def find_digest(self, key: str):
+        """
+        :param key: 原始数据摘要
+        :return: 已保存文件的路径，不存在时返回None
+        """
+        row = self.conn.execute(
+            'SELECT path FROM images WHERE key = ?', ('s:' + key,)
+        ).fetchone()
+
+        return row[0] if row else None
+
+    def find_render(self, key: str):
+        """
+        :param key: 渲染结果的摘要
+        :return: 已保存文件的路径，不存在时返回None
+        """
+        row = self.conn.execute(
+            'SELECT path FROM images WHERE key = ?', ('r:' + key,)
+        ).fetchone()
+
+        return row[0] if row else None
+
+    def add(self, path, key: str = None, render_key: str = None, width=None, height=None):
+        """
+        记录新保存的图片
+        :param path: 图片文件路径
+        :param key: 原始数据摘要
+        :param render_key: 渲染结果的摘要
+        :return:
+        """
+        with self.conn:
+            if key is not None:
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO images VALUES (?, 'stream', ?, ?, ?)",
+                    ('s:' + key, width, height, path)
+                )
+            if render_key is not None:
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO images VALUES (?, 'render', ?, ?, ?)",
+                    ('r:' + render_key, width, height, path)
+                )
+
+    def add_reference(self, document, name, path, key=''):
+        """
+        记录重复图片：`document`中的`name`与已保存的`path`相同
+        """
+        with self.conn:
+            self.conn.execute(
+                'INSERT INTO refs VALUES (?, ?, ?, ?, ?)', (document, name, key, path, time.time())
+            )
+
+    def remove_path(self, path):
+        """图片文件被删除后，移除其记录及指向它的引用"""
+        with self.conn:
+            self.conn.execute('DELETE FROM images WHERE path = ?', (path,))
+            self.conn.execute('DELETE FROM refs WHERE path = ?', (path,))
@@ -0,0 +1,449 @@
+"""
+多机分布式批处理：以共享目录中的租约文件作为任务表。
+
+每篇文档对应一个租约文件和一个完成标记，各节点遍历同一归档目录，用O_EXCL创建租约文件来领取任务，
+处理期间定期刷新租约的修改时间；节点宕机后租约超过`LEASE_TTL`即可被其他节点接管。
+完成标记持久保存，重启后已完成的文档自动跳过。
+出错、节点崩溃（租约被接管）记入失败标记，与受监督模式一样重试`MAX_RETRIES`次后隔离，不再领取。
+SQLite的文件锁在NFS上不可靠，因此不用数据库
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+
+from config import Config
+from log import get_logger, log_event
+
+logger = get_logger('jobs')
+
+# 节点进程因处理文档数或内存达到上限而退出时的退出码，父进程据此重启
+RECYCLE_EXIT_CODE = 75
+
+
+def iter_pdfs(root):
+    """
+    递归遍历目录，逐个返回pdf路径，不一次性列出整棵目录树
+    :param root: 归档根目录
+    :return:
+    """
+    stack = [root]
+
+    while stack:
+        dir_path = stack.pop()
+        try:
+            entries = sorted(os.scandir(dir_path), key=lambda e: e.name)
+        except OSError:
+            logger.error('无法读取目录：%s', dir_path)
+            continue
+
+        sub_dirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                sub_dirs.append(entry.path)
+            elif entry.name.endswith('.pdf'):
+                yield entry.path
+
+        stack.extend(sub_dirs[::-1])
+
+
+def write_atomic(fpath, content: str):
+    tmp = '{}.{}.{}.tmp'.format(fpath, socket.gethostname(), os.getpid())
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+    os.replace(tmp, fpath)
+
+
+class JobTable(object):
+    def __init__(self, job_path, ttl=300, root=None, max_retries=None):
+        """
+        :param job_path: 共享目录中存放租约、完成标记的位置
+        :param ttl: 租约有效期（秒）
+        :param root: 归档根目录，任务以相对此目录的路径标识，各节点的挂载位置、工作目录可以不同
+        :param max_retries: 失败后的重试次数，仍失败的文档隔离；为None时不限制
+        """
+        self.job_path = job_path
+        self.ttl = ttl
+        self.root = root
+        self.max_retries = max_retries
+        self.host = socket.gethostname()
+        self.owner = '{}:{}'.format(self.host, os.getpid())
+
+    def job_key(self, path) -> str:
+        """任务标识：相对归档根目录的路径，不在根目录下时为绝对路径"""
+        key = os.path.abspath(path)
+        if self.root is not None:
+            rel = os.path.relpath(key, os.path.abspath(self.root))
+            if rel != '..' and not rel.startswith('..' + os.sep):
+                key = rel.replace(os.sep, '/')
+
+        return key
+
+    def job_file(self, path, suffix):
+        job_id = hashlib.sha1(self.job_key(path).encode('utf-8')).hexdigest()
+        dir_name = os.path.join(self.job_path, job_id[:2])
+        if not os.path.exists(dir_name):
+            os.makedirs(dir_name, exist_ok=True)
+
+        return os.path.join(dir_name, job_id + suffix)
+
+    def is_done(self, path) -> bool:
+        return os.path.exists(self.job_file(path, '.done'))
+
+    def failed_attempts(self, path) -> int:
+        """已失败的次数"""
+        try:
+            with open(self.job_file(path, '.failed'), encoding='utf-8') as f:
+                return json.load(f)['attempts']
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def is_quarantined(self, path) -> bool:
+        return self.max_retries is not None and self.failed_attempts(path) > self.max_retries
+
+    def is_pending(self, path) -> bool:
+        """尚未完成、也未隔离"""
+        return not self.is_done(path) and not self.is_quarantined(path)
+
+    def fail(self, path, reason) -> bool:
+        """
+        记录一次失败，只由持有（或刚接管）租约的节点调用，同一时间只有一个节点写入
+        :param path: pdf路径
+        :param reason: error、crash或timeout
+        :return: 是否已隔离
+        """
+        attempts = self.failed_attempts(path) + 1
+        quarantined = self.max_retries is not None and attempts > self.max_retries
+
+        record = dict(path=path, reason=reason, attempts=attempts, quarantined=quarantined, owner=self.owner,
+                      time=round(time.time(), 3))
+        write_atomic(self.job_file(path, '.failed'), json.dumps(record, ensure_ascii=False))
+
+        log_event(reason, path=path, attempts=attempts)
+        if quarantined:
+            log_event('quarantine', path=path, reason=reason, attempts=attempts)
+
+        return quarantined
+
+    @staticmethod
+    def read_lease(lease):
+        """
+        :param lease: 租约文件
+        :return: (持有者, 修改时间)，文件不存在时返回None；刚创建、尚未写入内容时持有者为空
+        """
+        try:
+            mtime = os.stat(lease).st_mtime
+        except OSError:
+            return None
+
+        try:
+            with open(lease, encoding='utf-8') as f:
+                owner = json.load(f)['owner']
+        except (OSError, ValueError, KeyError):
+            owner = ''
+
+        return owner, mtime
+
+    def is_expired(self, info) -> bool:
+        """
+        租约是否过期：超过有效期未刷新，或持有者是本机上已退出的进程
+        :param info: `read_lease`的返回值
+        :return:
+        """
+        owner, mtime = info
+        if time.time() - mtime > self.ttl:
+            return True
+
+        host, _, pid = owner.rpartition(':')
+        if host != self.host or not pid.isdigit():
+            return False
+
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pass
+
+        return False
+
+    def take_lease(self, lease, info=None) -> bool:
+        """
+        将租约文件改名移走，确认移走的正是预期的租约（持有者及修改时间相同）；
+        否则说明判断之后租约已被其他节点接管、重新创建，将其放回
+        :param lease: 租约文件
+        :param info: 预期的(持有者, 修改时间)，为None时要求持有者为本进程
+        :return: 是否移走了预期的租约
+        """
+        stale = '{}.{}.stale'.format(lease, self.owner.replace(':', '.'))
+        try:
+            os.rename(lease, stale)
+        except OSError:
+            return False
+
+        taken = self.read_lease(stale)
+        if taken is not None and (taken == info if info is not None else taken[0] == self.owner):
+            os.remove(stale)
+            return True
+
+        # 放回：link在目标已存在时失败，不会覆盖期间新建的租约
+        try:
+            os.link(stale, lease)
+        except OSError:
+            pass
+        os.remove(stale)
+        return False
+
+    def claim(self, path) -> bool:
+        """
+        领取任务，已完成、已隔离或已被其他节点领取时返回False。
+        接管过期租约时，原持有者的处理记为一次失败（本机进程已退出为crash，否则为timeout）
+        :param path: pdf路径
+        :return:
+        """
+        if not self.is_pending(path):
+            return False
+
+        lease = self.job_file(path, '.lease')
+        for _ in range(2):
+            try:
+                fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                info = self.read_lease(lease)
+                if info is None:
+                    continue
+                if not self.is_expired(info):
+                    return False
+
+                # 接管过期租约：判断过期后租约可能已被其他节点接管，移走后需确认
+                if not self.take_lease(lease, info):
+                    return False
+
+                log_event('lease_expired', path=path, owner=self.owner, previous=info[0])
+                if self.fail(path, 'timeout' if time.time() - info[1] > self.ttl else 'crash'):
+                    return False
+                continue
+
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(dict(owner=self.owner, path=path, time=time.time()), f)
+
+            # 领取期间可能已被其他节点完成
+            if self.is_done(path):
+                self.release(path)
+                return False
+
+            return True
+
+        return False
+
+    def owns(self, path) -> bool:
+        info = self.read_lease(self.job_file(path, '.lease'))
+        return info is not None and info[0] == self.owner
+
+    def renew(self, path) -> bool:
+        """刷新租约，租约已被接管时返回False"""
+        lease = self.job_file(path, '.lease')
+        if not self.owns(path):
+            return False
+
+        try:
+            os.utime(lease)
+        except OSError:
+            return False
+
+        return True
+
+    def complete(self, path, result=None) -> bool:
+        """
+        写入完成标记并释放租约，租约已被其他节点接管时不写入
+        :return: 是否写入
+        """
+        if not self.owns(path):
+            logger.error('%s 的租约已被接管，不写入完成标记', path)
+            return False
+
+        record = dict(path=path, owner=self.owner, time=time.time(), result=result)
+        write_atomic(self.job_file(path, '.done'), json.dumps(record, ensure_ascii=False, default=str))
+        self.release(path)
+        return True
+
+    def release(self, path) -> bool:
+        """释放本进程持有的租约，不删除其他节点的租约"""
+        return self.take_lease(self.job_file(path, '.lease'))
+
+
+class Heartbeat(threading.Thread):
+    """处理期间定期刷新租约，租约被接管后标记为失效，当前文档的结果将被丢弃"""
+
+    def __init__(self, table: JobTable, path):
+        super().__init__(daemon=True)
+        self.table = table
+        self.path = path
+        self.stopped = threading.Event()
+        self.lost = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.table.ttl / 3):
+            if not self.table.renew(self.path):
+                logger.error('%s 的租约已被接管，停止处理', self.path)
+                self.lost.set()
+                return
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stopped.set()
+        self.join()
+
+
+def node_main(target, config: Config, root, recycle=True, index=0):
+    """
+    单个节点进程：遍历归档目录（或文档清单），逐个领取、处理文档
+    :param recycle: 处理文档数或内存达到上限时是否停止处理，由父进程重启
+    :param index: 本机上的节点序号，指标HTTP端口为`METRICS_PORT`加序号
+    :return: 汇总信息，因达到上限而停止时`recycled`为True
+    """
+    from memory import MemoryGovernor
+    from tasks import TASKS, extract_toc, get_toc_index, run_document
+
+    table = JobTable(config.job_path, config.lease_ttl, root, config.max_retries)
+    summary = dict(documents=0, errors=0, recycled=False)
+    start = time.time()
+    governor = MemoryGovernor(config, table.owner)
+
+    toc_index = None
+    if extract_toc in TASKS[target] and config.update_toc_index:
+        toc_index = get_toc_index(config)
+
+    exporter = None
+    if config.metrics_path:
+        from metrics import start_exporter
+        port = config.metrics_port + index if config.metrics_port else 0
+        exporter = start_exporter(config, table.owner.replace(':', '-'), port)
+
+    if config.use_catalog:
+        from catalog import iter_catalog_paths
+        paths = iter_catalog_paths(config)
+    else:
+        paths = iter_pdfs(root)
+
+    def process(path):
+        """处理已领取的文档"""
+        with Heartbeat(table, path) as heartbeat:
+            try:
+                result = run_document(target, path, config, toc_index)
+            except Exception as e:
+                logger.error('%s 处理出错：%s', path, e)
+                summary['errors'] += 1
+                table.fail(path, 'error')
+                table.release(path)
+                result = None
+                if exporter is not None:
+                    exporter.metrics.record_failure('error')
+            except BaseException:
+                # 中断时释放租约，不计入失败次数
+                table.release(path)
+                raise
+
+        # 租约已被接管时，由接管的节点完成该文档
+        if result is not None and (heartbeat.lost.is_set() or not table.complete(path, result)):
+            log_event('lease_lost', path=path, owner=table.owner)
+            result = None
+
+        if result is not None:
+            summary['documents'] += 1
+            if exporter is not None:
+                exporter.metrics.record_document(result)
+                exporter.metrics.set_rss()
+
+        governor.after_document()
+        if recycle and governor.should_recycle():
+            summary['recycled'] = True
+
+    # 遍历一遍后，仍有被其他节点领取、或出错待重试的文档时，每隔三分之一租约有效期再尝试一次，
+    # 其他节点崩溃后由仍在运行的节点接管其租约，直到所有文档完成或隔离
+    waiting = []
+    for path in paths:
+        if table.claim(path):
+            process(path)
+        if table.is_pending(path):
+            waiting.append(path)
+
+        if summary['recycled']:
+            break
+
+    while waiting and not summary['recycled']:
+        time.sleep(table.ttl / 3)
+        retry = []
+        for path in waiting:
+            if not summary['recycled'] and table.claim(path):
+                process(path)
+            if table.is_pending(path):
+                retry.append(path)
+
+        waiting = retry
+
+    if toc_index is not None:
+        toc_index.close()
+    if exporter is not None:
+        exporter.stop()
+
+    log_event('batch', task=target, node=table.owner, seconds=round(time.time() - start, 3), **summary)
+    return summary
+
+
+def run_distributed(target, config: Config = None, root=None):
+    """
+    以分布式模式处理`root`（默认为`ARTICLE_PATH`）下的所有pdf，本机启动`WORKERS`个节点进程
+    """
+    config = config or Config()
+    root = root or config.article_path
+
+    if config.workers <= 1:
+        return node_main(target, config, root, recycle=False)
+
+    from multiprocessing.connection import wait
+    from log import get_worker_queue
+
+    log_queue = get_worker_queue()
+
+    def spawn(index):
+        p = multiprocessing.Process(target=_node_process, args=(target, config, root, log_queue, index))
+        p.start()
+        return p
+
+    # {进程: 节点序号}，重启的进程沿用原序号
+    processes = {spawn(i): i for i in range(config.workers)}
+    while processes:
+        wait([p.sentinel for p in processes])
+        for p in [p for p in processes if not p.is_alive()]:
+            p.join()
+            index = processes.pop(p)
+            # 达到上限的节点进程退出后重启，已完成的文档会被跳过；
+            # 被信号结束（如fitz内部错误导致的段错误）的节点也重启，其租约由其他节点接管并计入失败次数
+            if p.exitcode == RECYCLE_EXIT_CODE:
+                log_event('worker_recycled', pid=p.pid)
+            elif p.exitcode is not None and p.exitcode < 0:
+                logger.error('节点进程%s崩溃，退出码%s，重启', p.pid, p.exitcode)
+                log_event('worker_crashed', pid=p.pid, exitcode=p.exitcode)
+            else:
+                if p.exitcode:
+                    logger.error('节点进程%s异常退出，退出码%s', p.pid, p.exitcode)
+                continue
+
+            processes[spawn(index)] = index
+
+
+def _node_process(target, config, root, log_queue, index=0):
+    from log import init_worker
+
+    init_worker(log_queue)
+    if node_main(target, config, root, index=index)['recycled']:
+        sys.exit(RECYCLE_EXIT_CODE)
@@ -1,27 +1,200 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import multiprocessing
 import os.path
+import queue
+import time
 
-from config import LOG_PATH
+from config import Config
 
+FORMATTER = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s ')
+# 各日志名的前缀，写入`LOG_PATH`下去掉前缀后的同名文件
+LOGGER_PREFIX = 'extract.'
+# 结构化事件日志，每行一个json，写入events.jsonl
+EVENT_LOG_NAME = LOGGER_PREFIX + 'events'
 
-def get_logger(name):
-    if not os.path.exists(LOG_PATH):
-        os.makedirs(LOG_PATH)
+# 所有日志记录先放入队列，由监听线程统一写文件、控制台，工作线程（进程）不做IO
+_queue = None
+_listeners = []
+_handlers = []
+_loggers = []
+# 日志位置及级别，默认为config.py中的值，可由`setup`按运行配置修改
+_log_path = Config().log_path
+_level = Config().log_level
 
-    log_name = '/'.join([LOG_PATH, name + '.log'])
 
-    logger = logging.getLogger(log_name)
-    logger.setLevel(logging.INFO)
+def setup(config: Config):
+    """
+    按运行配置设置日志位置及级别，子进程通过主进程的监听线程写文件，不需再调用
+    :param config:
+    :return:
+    """
+    global _log_path
 
-    if not logger.handlers:
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s ')
+    if config.log_path != _log_path:
+        _log_path = config.log_path
+        # 已打开的日志文件改写到新位置
+        for handler in _handlers:
+            if isinstance(handler, FileRouter):
+                handler.reset()
+
+    set_level(config.log_level)
+
+
+def get_log_file(name) -> str:
+    """日志名对应的文件"""
+    name = name[len(LOGGER_PREFIX):]
+    return os.path.join(_log_path, name + ('.jsonl' if name == 'events' else '.log'))
+
+
+class FileRouter(logging.Handler):
+    """按日志名写入对应文件，首次写入时才创建目录和文件"""
+
+    def __init__(self):
+        super().__init__()
+        self.file_handlers = dict()
+
+    def get_handler(self, name):
+        if name not in self.file_handlers:
+            fpath = get_log_file(name)
+            dir_name = os.path.dirname(fpath)
+            if dir_name and not os.path.exists(dir_name):
+                os.makedirs(dir_name, exist_ok=True)
+
+            handler = logging.FileHandler(fpath, encoding='utf-8')
+            if name == EVENT_LOG_NAME:
+                handler.setFormatter(logging.Formatter('%(message)s'))
+            else:
+                handler.setFormatter(FORMATTER)
+
+            self.file_handlers[name] = handler
+
+        return self.file_handlers[name]
+
+    def emit(self, record):
+        try:
+            self.get_handler(record.name).emit(record)
+        except Exception:
+            self.handleError(record)
+
+    def reset(self):
+        for handler in self.file_handlers.values():
+            handler.close()
+        self.file_handlers = dict()
+
+    def close(self):
+        self.reset()
+        super().close()
+
+
+def get_handlers():
+    if not _handlers:
         con_handle = logging.StreamHandler()
-        file_handle = logging.FileHandler(log_name)
+        con_handle.setFormatter(FORMATTER)
+        # 结构化事件只写文件
+        con_handle.addFilter(lambda record: record.name != EVENT_LOG_NAME)
+
+        _handlers.extend([FileRouter(), con_handle])
+
+    return _handlers
+
+
+def start_listener(q):
+    listener = logging.handlers.QueueListener(q, *get_handlers())
+    listener.start()
+    _listeners.append(listener)
+
+
+def get_queue():
+    global _queue
+
+    if _queue is None:
+        _queue = queue.Queue(-1)
+        start_listener(_queue)
 
-        file_handle.setFormatter(formatter)
-        con_handle.setFormatter(formatter)
+    return _queue
 
-        logger.addHandler(file_handle)
-        logger.addHandler(con_handle)
+
+def get_worker_queue():
+    """
+    获取可传给子进程的日志队列，子进程需以`init_worker`为初始化函数
+    :return:
+    """
+    q = multiprocessing.Queue(-1)
+    start_listener(q)
+    return q
+
+
+def init_worker(q):
+    """
+    子进程初始化：所有日志改为写入主进程监听的队列
+    :param q: `get_worker_queue`返回的队列
+    :return:
+    """
+    global _queue
+
+    # fork得到的子进程中，监听线程并不存在
+    del _listeners[:]
+    _queue = q
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """首次写日志时才获取队列、启动监听线程，导入模块时没有副作用"""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+
+    def enqueue(self, record):
+        get_queue().put_nowait(record)
+
+
+@atexit.register
+def stop_listeners():
+    while _listeners:
+        _listeners.pop().stop()
+
+
+def get_logger(name):
+    logger = logging.getLogger(LOGGER_PREFIX + name)
+    logger.setLevel(_level)
+    logger.propagate = False
+
+    if not logger.handlers:
+        logger.addHandler(QueueHandler())
+        _loggers.append(logger)
 
     return logger
+
+
+def set_level(level):
+    """
+    修改所有日志的级别
+    :param level: 日志级别，如'DEBUG'
+    :return:
+    """
+    global _level
+
+    _level = level
+    for logger in _loggers:
+        logger.setLevel(level)
+
+
+def log_event(event, **fields):
+    """
+    记录一条结构化事件，如单篇文档的处理结果、批次汇总
+    :param event: 事件名
+    :param fields: 事件内容，需可json序列化
+    :return:
+    """
+    logger = logging.getLogger(EVENT_LOG_NAME)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    if not logger.handlers:
+        logger.addHandler(QueueHandler())
+
+    record = dict(time=round(time.time(), 3), event=event, pid=os.getpid())
+    record.update(fields)
+    logger.info(json.dumps(record, ensure_ascii=False, default=str))
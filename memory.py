@@ -0,0 +1,117 @@
+"""
+批处理进程的内存控制：限制fitz全局对象缓存、定期记录内存快照，并判断进程是否应退出重启。
+fitz的对象缓存、pdfminer的符号表等为进程级，关闭文档后并不释放，长时间运行时只能靠重启进程回收
+"""
+import gc
+import sys
+import tracemalloc
+
+from config import Config
+from log import get_logger, log_event
+from metrics import get_rss
+
+logger = get_logger('memory')
+
+# 内存快照中记录的分配位置数
+TOP_ALLOCATIONS = 10
+
+
+def get_fitz_store_size():
+    """
+    fitz全局对象缓存的大小（字节），未导入fitz时为0。
+    新版PyMuPDF中`TOOLS.store_size`为方法且不再返回大小，此时为None
+    """
+    fitz = sys.modules.get('fitz')
+    if fitz is None:
+        return 0
+
+    size = fitz.TOOLS.store_size
+    return size() if callable(size) else size
+
+
+def shrink_fitz_store(max_size=0):
+    """
+    释放fitz全局对象缓存，未导入fitz时不处理
+    :param max_size: 释放后的大小上限，为0时全部释放；无法获得缓存大小时只做全部释放
+    :return: 释放后的大小，无法获得时为None
+    """
+    fitz = sys.modules.get('fitz')
+    if fitz is None:
+        return 0
+
+    size = get_fitz_store_size()
+    if size is None:
+        if not max_size:
+            fitz.TOOLS.store_shrink(100)
+        return get_fitz_store_size()
+
+    if size <= max_size:
+        return size
+
+    # store_shrink按当前大小的百分比释放
+    percent = 100 if not max_size else min(100, int((size - max_size) * 100 / size) + 1)
+    fitz.TOOLS.store_shrink(percent)
+    return get_fitz_store_size()
+
+
+class MemoryGovernor(object):
+    def __init__(self, config: Config = None, name='main'):
+        """
+        :param config:
+        :param name: 进程名称，记录在内存快照中
+        """
+        self.config = config or Config()
+        self.name = name
+        self.documents = 0
+        self.snapshot = None
+
+        if self.config.snapshot_every and self.config.tracemalloc_frames and not tracemalloc.is_tracing():
+            tracemalloc.start(self.config.tracemalloc_frames)
+
+    def after_document(self):
+        """每篇文档处理后调用：回收循环引用，控制fitz缓存大小，按需记录快照"""
+        self.documents += 1
+        gc.collect()
+
+        if self.config.shrink_every and self.documents % self.config.shrink_every == 0:
+            shrink_fitz_store()
+        else:
+            shrink_fitz_store(self.config.fitz_store_maxsize)
+
+        if self.config.snapshot_every and self.documents % self.config.snapshot_every == 0:
+            self.take_snapshot()
+
+    def take_snapshot(self):
+        """记录常驻内存、fitz缓存大小，开启tracemalloc时同时记录与上次快照相比增长最多的分配位置"""
+        fields = dict(worker=self.name, documents=self.documents, rss=get_rss(), fitz_store=get_fitz_store_size())
+
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__)
+            ])
+            if self.snapshot is None:
+                stats = [(s.traceback[0], s.size, s.size) for s in snapshot.statistics('lineno')]
+            else:
+                stats = [(s.traceback[0], s.size, s.size_diff) for s in snapshot.compare_to(self.snapshot, 'lineno')]
+
+            fields['traced'] = tracemalloc.get_traced_memory()[0]
+            fields['top'] = [
+                dict(location=str(frame), size=size, growth=growth)
+                for frame, size, growth in stats[:TOP_ALLOCATIONS]
+            ]
+            self.snapshot = snapshot
+
+        log_event('memory_snapshot', **fields)
+
+    def should_recycle(self) -> bool:
+        """处理的文档数或常驻内存超过上限时，进程应退出并由父进程重启"""
+        if self.config.worker_max_docs and self.documents >= self.config.worker_max_docs:
+            return True
+
+        if self.config.worker_max_rss:
+            rss = get_rss()
+            if rss >= self.config.worker_max_rss:
+                logger.info('%s 常驻内存%s字节，超过上限', self.name, rss)
+                return True
+
+        return False
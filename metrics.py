@@ -0,0 +1,263 @@
+"""
+批处理运行指标：文档、页、图表数，各阶段耗时分布，错误、超时数，队列长度及进程内存。
+以Prometheus文本格式定期写入`METRICS_PATH`，可选在本机端口提供HTTP访问
+"""
+import os
+import resource
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from config import Config
+from log import get_logger
+
+logger = get_logger('metrics')
+
+# 各阶段耗时直方图的分桶（秒）
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in labels) + '}'
+
+
+class Metric(object):
+    def __init__(self, name, help_text, kind):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.values = dict()
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help_text), '# TYPE {} {}'.format(self.name, self.kind)]
+        for labels, value in sorted(self.values.items()):
+            lines.append('{}{} {}'.format(self.name, format_labels(labels), value))
+
+        return lines
+
+
+class Counter(Metric):
+    def __init__(self, name, help_text):
+        super().__init__(name, help_text, 'counter')
+
+    def inc(self, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    def __init__(self, name, help_text):
+        super().__init__(name, help_text, 'gauge')
+
+    def set(self, value, **labels):
+        self.values[tuple(sorted(labels.items()))] = value
+
+    def clear(self):
+        self.values = dict()
+
+
+class Histogram(Metric):
+    def __init__(self, name, help_text, buckets=BUCKETS):
+        super().__init__(name, help_text, 'histogram')
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        if key not in self.values:
+            self.values[key] = [[0] * len(self.buckets), 0, 0]
+
+        counts, _, _ = item = self.values[key]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        item[1] += value
+        item[2] += 1
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help_text), '# TYPE {} histogram'.format(self.name)]
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            for bound, c in zip(self.buckets, counts):
+                lines.append('{}_bucket{} {}'.format(self.name, format_labels(labels + (('le', bound),)), c))
+            lines.append('{}_bucket{} {}'.format(self.name, format_labels(labels + (('le', '+Inf'),)), count))
+            lines.append('{}_sum{} {}'.format(self.name, format_labels(labels), round(total, 6)))
+            lines.append('{}_count{} {}'.format(self.name, format_labels(labels), count))
+
+        return lines
+
+
+def get_rss(pid=None) -> int:
+    """
+    进程常驻内存（字节），读取/proc，不支持时返回当前进程的峰值内存
+    :param pid: 进程号，默认为当前进程
+    :return:
+    """
+    try:
+        with open('/proc/{}/status'.format(pid or 'self')) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    if pid is None or pid == os.getpid():
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    return 0
+
+
+class Metrics(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.time()
+
+        self.documents = Counter('extract_documents_total', '已处理的文档数')
+        self.pages = Counter('extract_pages_total', '已处理的页数')
+        self.figures = Counter('extract_figures_total', '已保存的图表数')
+        self.references = Counter('extract_figure_references_total', '与已保存图片重复、只记录引用的图表数')
+        self.failures = Counter('extract_failures_total', '出错、超时、崩溃的文档数')
+        self.stage_seconds = Histogram('extract_stage_seconds', '单篇文档各阶段耗时')
+        self.rate = Gauge('extract_rate', '开始运行以来的平均处理速度（每秒）')
+        self.queue_depth = Gauge('extract_queue_depth', '等待处理的文档数')
+        self.rss = Gauge('extract_worker_rss_bytes', '进程常驻内存')
+
+        self.metrics = [
+            self.documents, self.pages, self.figures, self.references, self.failures,
+            self.stage_seconds, self.rate, self.queue_depth, self.rss
+        ]
+
+    def record_document(self, result: dict, status='ok'):
+        """
+        记录一篇文档的处理结果
+        :param result: `tasks.run_document`的返回值
+        :param status: 处理状态
+        :return:
+        """
+        with self.lock:
+            stats = result.get('extract_figures') or {}
+            status = stats.get('status', status)
+
+            self.documents.inc(status=status)
+            if status != 'ok':
+                self.failures.inc(reason=status)
+
+            self.pages.inc(stats.get('pages', 0))
+            self.figures.inc(stats.get('images', 0) - stats.get('deleted', 0))
+            self.references.inc(stats.get('references', 0))
+
+            seconds = dict(result.get('seconds', {}))
+            seconds.update(stats.get('stages', {}))
+            for stage, value in seconds.items():
+                self.stage_seconds.observe(value, stage=stage)
+
+    def record_failure(self, reason):
+        with self.lock:
+            self.documents.inc(status=reason)
+            self.failures.inc(reason=reason)
+
+    def set_queue_depth(self, value):
+        with self.lock:
+            self.queue_depth.set(value)
+
+    def set_rss(self, pids=None):
+        """
+        更新各进程内存
+        :param pids: {名称: 进程号}，默认为当前进程
+        :return:
+        """
+        pids = pids or {'main': os.getpid()}
+
+        with self.lock:
+            self.rss.clear()
+            for name, pid in pids.items():
+                self.rss.set(get_rss(pid), worker=name)
+
+    def render(self) -> str:
+        with self.lock:
+            elapsed = max(time.time() - self.start, 1e-6)
+            self.rate.clear()
+            self.rate.set(round(sum(self.documents.values.values()) / elapsed, 4), unit='documents')
+            self.rate.set(round(sum(self.pages.values.values()) / elapsed, 4), unit='pages')
+            self.rate.set(round(sum(self.figures.values.values()) / elapsed, 4), unit='figures')
+
+            lines = []
+            for metric in self.metrics:
+                lines.extend(metric.render())
+
+        return '\n'.join(lines) + '\n'
+
+
+class Exporter(threading.Thread):
+    """定期将指标写入文件，可选提供HTTP访问"""
+
+    def __init__(self, metrics: Metrics, fpath, interval=10, port=0):
+        super().__init__(daemon=True)
+        self.metrics = metrics
+        self.fpath = fpath
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.server = None
+
+        if port:
+            try:
+                self.server = HTTPServer(('127.0.0.1', port), self.get_handler())
+            except OSError as e:
+                # 端口被占用时只写文件，不影响处理
+                logger.error('指标端口%s不可用：%s', port, e)
+            else:
+                threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def get_handler(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def write(self):
+        dir_name = os.path.dirname(self.fpath)
+        if dir_name and not os.path.exists(dir_name):
+            os.makedirs(dir_name, exist_ok=True)
+
+        tmp = self.fpath + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self.metrics.render())
+        os.replace(tmp, self.fpath)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        self.stopped.set()
+        self.write()
+        if self.server is not None:
+            self.server.shutdown()
+
+
+def start_exporter(config: Config, name='extract', port=None) -> Exporter:
+    """
+    创建指标并开始定期导出
+    :param config:
+    :param name: 指标文件名，多个进程同时运行时需各不相同
+    :param port: HTTP端口，默认为`METRICS_PORT`，多个进程同时运行时需各不相同
+    :return: 导出线程，其`metrics`属性为指标对象
+    """
+    fpath = os.path.join(config.metrics_path, name + '.prom')
+    port = config.metrics_port if port is None else port
+    exporter = Exporter(Metrics(), fpath, config.metrics_interval, port)
+    exporter.start()
+
+    return exporter
@@ -0,0 +1,108 @@
+"""
+跨文档的页面缓存。
+各期中常有与其他期完全相同的页面（广告、学会通知、目录页模板），以页面内容流及其引用的字体、图片、
+表单对象计算指纹，已处理过的页面直接复用缓存的结果（图表区域及名称、目录标题），不再解析、检测表格
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+# 提取逻辑变化、缓存结果不再适用时递增
+CACHE_VERSION = 1
+
+# 字体子集前缀（如ABCDEF+），同一字体在不同文档中前缀随机
+SUBSET_COMPILE = re.compile(r'^[A-Z]{6}\+')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pages (
+    key TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created REAL,
+    PRIMARY KEY (key, kind)
+) WITHOUT ROWID;
+'''
+
+
+def page_fingerprint(page) -> str:
+    """
+    页面指纹：页面尺寸、解压后的内容流、字体名称（去掉子集前缀）、图片及表单对象的原始数据
+    :param page: fitz页对象
+    :return:
+    """
+    doc = page.parent
+    h = hashlib.sha1()
+    h.update(repr((CACHE_VERSION, tuple(page.rect), tuple(page.mediabox), page.rotation)).encode('utf-8'))
+    h.update(page.read_contents())
+
+    # 资源中的xref编号因文档而异，不计入指纹
+    for font in page.get_fonts():
+        ext, font_type, basefont, name, encoding = font[1:6]
+        h.update(repr((ext, font_type, SUBSET_COMPILE.sub('', basefont), name, encoding)).encode('utf-8'))
+
+    for img in page.get_images(full=True):
+        h.update(repr(img[2:9]).encode('utf-8'))
+        h.update(doc.xref_stream_raw(img[0]) or b'')
+
+    for xref, name, _, bbox in page.get_xobjects():
+        h.update(repr((name, tuple(bbox))).encode('utf-8'))
+        h.update(doc.xref_stream_raw(xref) or b'')
+
+    return h.hexdigest()
+
+
+def get_kind(name, *settings) -> str:
+    """
+    缓存类型，影响结果的配置项不同时互不复用
+    :param name: figures或toc
+    :param settings: 影响结果的配置项
+    :return:
+    """
+    return '{}:{}'.format(name, hashlib.sha1(repr(settings).encode('utf-8')).hexdigest()[:12])
+
+
+class PageCache(object):
+    def __init__(self, db_path):
+        """
+        :param db_path: 缓存位置，多机处理时SQLite的文件锁在NFS上不可靠，各节点应使用本地路径
+        """
+        dir_name = os.path.dirname(db_path)
+        if dir_name and not os.path.exists(dir_name):
+            os.makedirs(dir_name, exist_ok=True)
+
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get(self, key, kind):
+        """
+        :return: 缓存的结果，不存在时返回None
+        """
+        row = self.conn.execute('SELECT value FROM pages WHERE key = ? AND kind = ?', (key, kind)).fetchone()
+        if row is None:
+            return None
+
+        with self.conn:
+            self.conn.execute('UPDATE pages SET hits = hits + 1 WHERE key = ? AND kind = ?', (key, kind))
+
+        return json.loads(row[0])
+
+    def put(self, key, kind, value):
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR IGNORE INTO pages (key, kind, value, created) VALUES (?, ?, ?, ?)',
+                (key, kind, json.dumps(value, ensure_ascii=False), time.time())
+            )
@@ -0,0 +1,95 @@
+"""
+按目录导出正文：逐页分类时将正文文本归入当前标题，标题切换时即写出上一节，
+结果为每行一节的jsonl，只在内存中保留当前一节的文本
+"""
+import json
+import os
+
+from tree import Tree
+
+
+class SectionWriter(object):
+    def __init__(self, fpath, tree: Tree, document=None):
+        """
+        :param fpath: 结果文件路径
+        :param tree: 目录树，写出时按当时的树计算标题路径（沿父结点向上查找，不遍历整棵树）
+        :param document: 文档名，写入每一节
+        """
+        self.fpath = fpath
+        self.tree = tree
+        self.document = document
+        self.node = None
+        self.texts = []
+        self.pages = None
+        self.count = 0
+
+        dir_name = os.path.dirname(fpath)
+        if dir_name and not os.path.exists(dir_name):
+            os.makedirs(dir_name, exist_ok=True)
+
+        # 写入临时文件，完成后替换，出错时不留下不完整的结果
+        self.tmp = fpath + '.tmp'
+        self.fp = open(self.tmp, 'w', encoding='utf-8')
+
+    def switch(self, node):
+        """当前标题结点变化时写出上一节"""
+        if node is self.node:
+            return
+
+        self.flush()
+        self.node = node
+
+    def add(self, text: str, page_number: int):
+        """
+        :param text: 正文文本，换行处已含换行符
+        :param page_number: 所在页码，换页时加换行符
+        :return:
+        """
+        if self.texts and page_number != self.pages[1] and not text.startswith('\n'):
+            text = '\n' + text
+        elif not self.texts:
+            text = text.lstrip('\n')
+
+        if not text:
+            return
+
+        self.texts.append(text)
+        if self.pages is None:
+            self.pages = [page_number, page_number]
+        else:
+            self.pages[1] = page_number
+
+    def flush(self):
+        if self.texts:
+            if self.node is None:
+                path, level = (), None
+            else:
+                path, level = self.tree.find_path(self.node), getattr(self.node, 'level', None)
+
+            record = dict(
+                document=self.document,
+                path=path,
+                level=level,
+                page_start=self.pages[0],
+                page_end=self.pages[1],
+                text=''.join(self.texts)
+            )
+            self.fp.write(json.dumps(record, ensure_ascii=False))
+            self.fp.write('\n')
+            self.count += 1
+
+        self.texts, self.pages = [], None
+
+    def close(self, completed=True):
+        """
+        :param completed: 为False时丢弃结果
+        :return:
+        """
+        if completed:
+            self.flush()
+        self.fp.close()
+
+        if completed:
+            os.replace(self.tmp, self.fpath)
+        else:
+            os.remove(self.tmp)
@@ -0,0 +1,244 @@
+"""
+受监督的批处理：每篇文档在可结束的子进程中处理。
+超时或子进程崩溃（如fitz、pdfminer内部错误）时结束并重启该进程，文档重试`MAX_RETRIES`次后记入隔离列表，
+单篇文档不会拖住整个批次
+"""
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from collections import deque
+from multiprocessing.connection import wait
+
+from config import Config
+from log import get_logger, get_worker_queue, init_worker, log_event
+
+logger = get_logger('supervisor')
+
+# 失败原因对应的汇总字段
+FAILURE_KEYS = {'timeout': 'timeouts', 'crash': 'crashes'}
+
+
+def worker_main(target, config: Config, conn, log_queue):
+    """
+    子进程：从`conn`接收文档路径，处理后返回(状态, 结果, 是否退出重启)，收到None或需要重启时退出
+    """
+    init_worker(log_queue)
+
+    from memory import MemoryGovernor
+    from tasks import TASKS, extract_toc, get_toc_index, run_document
+
+    governor = MemoryGovernor(config, str(os.getpid()))
+
+    toc_index = None
+    if extract_toc in TASKS[target] and config.update_toc_index:
+        toc_index = get_toc_index(config)
+
+    while True:
+        path = conn.recv()
+        if path is None:
+            break
+
+        try:
+            status, result = 'ok', run_document(target, path, config, toc_index)
+        except Exception:
+            status, result = 'error', traceback.format_exc()
+
+        governor.after_document()
+        recycle = governor.should_recycle()
+        conn.send((status, result, recycle))
+        if recycle:
+            break
+
+    if toc_index is not None:
+        toc_index.close()
+
+
+class Worker(object):
+    def __init__(self, target, config: Config, log_queue):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=worker_main, args=(target, config, child_conn, log_queue), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        # 当前任务：(路径, 已尝试次数, 开始时间)
+        self.job = None
+        # 子进程处理完当前文档后将退出，需重启
+        self.retiring = False
+
+    def assign(self, path, attempts):
+        self.conn.send(path)
+        self.job = (path, attempts, time.time())
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class Supervisor(object):
+    def __init__(self, target, config: Config = None):
+        self.target = target
+        self.config = config or Config()
+        self.log_queue = None
+        self.workers = []
+        self.pending = deque()
+        self.summary = dict(documents=0, errors=0, timeouts=0, crashes=0, quarantined=0, recycled=0)
+        self.exporter = None
+
+    def spawn(self):
+        return Worker(self.target, self.config, self.log_queue)
+
+    def quarantined(self) -> set:
+        """已隔离的文档路径"""
+        if not os.path.exists(self.config.quarantine_path):
+            return set()
+
+        with open(self.config.quarantine_path, encoding='utf-8') as f:
+            return {json.loads(line)['path'] for line in f if line.strip()}
+
+    def quarantine(self, path, reason, attempts):
+        dir_name = os.path.dirname(self.config.quarantine_path)
+        if dir_name and not os.path.exists(dir_name):
+            os.makedirs(dir_name)
+
+        with open(self.config.quarantine_path, 'a', encoding='utf-8') as f:
+            record = dict(path=path, reason=reason, attempts=attempts, time=round(time.time(), 3))
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+        self.summary['quarantined'] += 1
+        log_event('quarantine', path=path, reason=reason, attempts=attempts)
+
+    def on_result(self, worker: Worker):
+        path = worker.job[0]
+        status, result, worker.retiring = worker.conn.recv()
+        worker.job = None
+
+        self.summary['documents'] += 1
+        if status != 'ok':
+            self.summary['errors'] += 1
+            logger.error('%s 处理出错：\n%s', path, result)
+
+        if self.exporter is not None:
+            if status == 'ok':
+                self.exporter.metrics.record_document(result)
+            else:
+                self.exporter.metrics.record_failure(status)
+
+    def on_failure(self, index, reason):
+        """子进程超时或崩溃：重启进程，文档重试或隔离"""
+        worker = self.workers[index]
+        path, attempts, start = worker.job
+
+        worker.kill()
+        self.workers[index] = self.spawn()
+
+        self.summary[FAILURE_KEYS[reason]] += 1
+        if self.exporter is not None:
+            self.exporter.metrics.record_failure(reason)
+        logger.error('%s %s（%.1f秒，退出码%s）', path, reason, time.time() - start, worker.process.exitcode)
+        log_event(reason, path=path, attempts=attempts + 1, seconds=round(time.time() - start, 3))
+
+        if attempts < self.config.max_retries:
+            self.pending.append((path, attempts + 1))
+        else:
+            self.quarantine(path, reason, attempts + 1)
+
+    def check_workers(self):
+        now = time.time()
+
+        for i, worker in enumerate(self.workers):
+            if worker.job is None:
+                continue
+
+            if not worker.process.is_alive():
+                # 进程退出前可能已返回结果，不在except中重启进程，以免子进程继承异常上下文
+                try:
+                    self.on_result(worker)
+                    crashed = False
+                except (EOFError, OSError):
+                    crashed = True
+
+                if crashed:
+                    self.on_failure(i, 'crash')
+                else:
+                    self.summary['recycled'] += worker.retiring
+                    self.workers[i] = self.spawn()
+            elif now - worker.job[2] > self.config.doc_timeout:
+                self.on_failure(i, 'timeout')
+
+    def recycle_workers(self):
+        """重启处理文档数或内存达到上限、已自行退出的子进程"""
+        for i, worker in enumerate(self.workers):
+            if worker.job is None and worker.retiring:
+                worker.stop()
+                self.workers[i] = self.spawn()
+                self.summary['recycled'] += 1
+                log_event('worker_recycled', pid=worker.process.pid)
+
+    def update_gauges(self):
+        metrics = self.exporter.metrics
+        metrics.set_queue_depth(len(self.pending))
+
+        pids = {'main': os.getpid()}
+        pids.update({str(i): w.process.pid for i, w in enumerate(self.workers)})
+        metrics.set_rss(pids)
+
+    def run(self, paths):
+        """
+        处理所有文档，已在隔离列表中的文档跳过
+        :param paths: pdf路径
+        :return: 汇总信息
+        """
+        start = time.time()
+        skipped = self.quarantined()
+        self.pending.extend((p, 0) for p in paths if p not in skipped)
+
+        self.log_queue = get_worker_queue()
+        self.workers = [self.spawn() for _ in range(max(1, self.config.workers))]
+
+        if self.config.metrics_path:
+            from metrics import start_exporter
+            self.exporter = start_exporter(self.config)
+
+        try:
+            while self.pending or any(w.job for w in self.workers):
+                if self.exporter is not None:
+                    self.update_gauges()
+
+                self.recycle_workers()
+                for worker in self.workers:
+                    if worker.job is None and self.pending:
+                        worker.assign(*self.pending.popleft())
+
+                busy = {w.conn: w for w in self.workers if w.job is not None}
+                for conn in wait(list(busy), timeout=1):
+                    try:
+                        self.on_result(busy[conn])
+                    except (EOFError, OSError):
+                        # 进程已崩溃，由check_workers处理
+                        pass
+
+                self.check_workers()
+        finally:
+            for worker in self.workers:
+                worker.stop()
+            if self.exporter is not None:
+                self.update_gauges()
+                self.exporter.stop()
+
+        log_event('batch', task=self.target, seconds=round(time.time() - start, 3), **self.summary)
+        return self.summary
@@ -0,0 +1,186 @@
+"""
+基于表格线的快速表格区域检测。
+
+pdfplumber的find_tables会计算所有交点、单元格及单元格中的文字，而截图只用到表格的外接矩形。
+这里只做三步：按坐标排序后将相近的线段对齐、合并，横线与竖线相交时连通，
+取包含至少两条横线、两条竖线的连通分量中交点的外接矩形作为表格区域
+"""
+import bisect
+import os
+import sys
+import time
+from typing import List, Tuple
+
+from cluster import UnionFind
+
+Coordinates = Tuple[float, float, float, float]
+# 线段：(所在直线的坐标, 起点, 终点)，横线为(top, x0, x1)，竖线为(x, top, bottom)
+Segment = Tuple[float, float, float]
+
+# 与pdfplumber中table_settings的默认值一致
+SNAP_TOLERANCE = 3
+JOIN_TOLERANCE = 3
+EDGE_MIN_LENGTH = 3
+INTERSECTION_TOLERANCE = 3
+
+
+def snap_segments(segments: List[Segment], tolerance, join_tolerance) -> List[Segment]:
+    """
+    对齐与合并：所在直线坐标相差不超过`tolerance`的线段取平均坐标，
+    同一直线上首尾间隔不超过`join_tolerance`的线段合并为一条
+    """
+    if not segments:
+        return []
+
+    segments = sorted(segments)
+    groups, group = [], [segments[0]]
+    for seg in segments[1:]:
+        if seg[0] - group[-1][0] <= tolerance:
+            group.append(seg)
+        else:
+            groups.append(group)
+            group = [seg]
+    groups.append(group)
+
+    result = []
+    for group in groups:
+        pos = sum(s[0] for s in group) / len(group)
+        spans = sorted((s[1], s[2]) for s in group)
+
+        start, end = spans[0]
+        for s, e in spans[1:]:
+            if s - end <= join_tolerance:
+                end = max(end, e)
+            else:
+                result.append((pos, start, end))
+                start, end = s, e
+        result.append((pos, start, end))
+
+    return result
+
+
+def get_segments(page, min_length=EDGE_MIN_LENGTH):
+    """
+    页面中对齐、合并后的横线与竖线
+    :param page: pdfplumber页对象
+    :param min_length: 短于此值的线段忽略
+    :return: (横线列表, 竖线列表)
+    """
+    h_segments = [
+        (e['top'], e['x0'], e['x1']) for e in page.horizontal_edges if e['x1'] - e['x0'] >= min_length
+    ]
+    v_segments = [
+        (e['x0'], e['top'], e['bottom']) for e in page.vertical_edges if e['bottom'] - e['top'] >= min_length
+    ]
+
+    return (
+        snap_segments(h_segments, SNAP_TOLERANCE, JOIN_TOLERANCE),
+        snap_segments(v_segments, SNAP_TOLERANCE, JOIN_TOLERANCE)
+    )
+
+
+def find_table_boxes(page, tolerance=INTERSECTION_TOLERANCE) -> List[Coordinates]:
+    """
+    检测表格区域
+    :param page: pdfplumber页对象
+    :param tolerance: 判断横线与竖线相交的容差
+    :return: 表格外接矩形(x0, top, x1, bottom)列表，按位置排序
+    """
+    h_segments, v_segments = get_segments(page)
+    if len(h_segments) < 2 or len(v_segments) < 2:
+        return []
+
+    # 竖线按x排序，每条横线只与x范围内的竖线比较
+    v_segments.sort()
+    v_xs = [v[0] for v in v_segments]
+    n = len(h_segments)
+    uf = UnionFind(n + len(v_segments))
+    # 各横线、竖线上的交点
+    points = dict()
+
+    for i, (y, x0, x1) in enumerate(h_segments):
+        lo = bisect.bisect_left(v_xs, x0 - tolerance)
+        hi = bisect.bisect_right(v_xs, x1 + tolerance)
+        for j in range(lo, hi):
+            x, top, bottom = v_segments[j]
+            if top - tolerance <= y <= bottom + tolerance:
+                uf.union(i, n + j)
+                points.setdefault(i, []).append((x, y))
+                points.setdefault(n + j, []).append((x, y))
+
+    # 各连通分量：[横线数, 竖线数, x0, top, x1, bottom]
+    components = dict()
+    for k, pts in points.items():
+        root = uf.find(k)
+        item = components.setdefault(root, [0, 0, float('inf'), float('inf'), float('-inf'), float('-inf')])
+        item[0 if k < n else 1] += 1
+        for x, y in pts:
+            item[2], item[3] = min(item[2], x), min(item[3], y)
+            item[4], item[5] = max(item[4], x), max(item[5], y)
+
+    return sorted(
+        (x0, top, x1, bottom)
+        for h_count, v_count, x0, top, x1, bottom in components.values()
+        if h_count >= 2 and v_count >= 2 and x1 > x0 and bottom > top
+    )
+
+
+def iou(c1: Coordinates, c2: Coordinates) -> float:
+    w = min(c1[2], c2[2]) - max(c1[0], c2[0])
+    h = min(c1[3], c2[3]) - max(c1[1], c2[1])
+    if w <= 0 or h <= 0:
+        return 0
+
+    inter = w * h
+    area1 = (c1[2] - c1[0]) * (c1[3] - c1[1])
+    area2 = (c2[2] - c2[0]) * (c2[3] - c2[1])
+    return inter / (area1 + area2 - inter)
+
+
+def compare(paths, threshold=0.9) -> dict:
+    """
+    与pdfplumber的find_tables对比检测结果及耗时
+    :param paths: pdf路径
+    :param threshold: 交并比不小于此值视为同一表格
+    :return: 汇总信息，含双方表格数、匹配数及总耗时
+    """
+    import pdfplumber
+
+    summary = dict(pages=0, expected=0, found=0, matched=0, pdfplumber_seconds=0, ruling_seconds=0)
+    for path in paths:
+        with pdfplumber.open(path) as pdf:
+            for page in pdf.pages:
+                # 两种方法都会用到的线段先计算一次，不计入耗时
+                _ = page.edges
+
+                start = time.time()
+                expected = [t.bbox for t in page.find_tables()]
+                summary['pdfplumber_seconds'] += time.time() - start
+
+                start = time.time()
+                found = find_table_boxes(page)
+                summary['ruling_seconds'] += time.time() - start
+
+                summary['pages'] += 1
+                summary['expected'] += len(expected)
+                summary['found'] += len(found)
+                for e in expected:
+                    if any(iou(e, f) >= threshold for f in found):
+                        summary['matched'] += 1
+                    else:
+                        print('{} 第{}页未匹配：{}'.format(path, page.page_number, e))
+
+    return summary
+
+
+if __name__ == '__main__':
+    from config import Config
+
+    args = sys.argv[1:] or [
+        os.path.join(Config().article_path, f) for f in sorted(os.listdir(Config().article_path)) if f.endswith('.pdf')
+    ]
+    ret = compare(args)
+    ret['recall'] = round(ret['matched'] / max(ret['expected'], 1), 4)
+    ret['precision'] = round(ret['matched'] / max(ret['found'], 1), 4)
+    ret['speedup'] = round(ret['pdfplumber_seconds'] / max(ret['ruling_seconds'], 1e-6), 1)
+    print(ret)
@@ -0,0 +1,90 @@
+"""
+提取任务：单篇文档的目录、图表提取，供命令行及批处理进程调用
+"""
+import os
+import time
+
+from config import Config
+
+
+def iter_pdf_paths(config: Config, paths=None):
+    """
+    获取待处理的pdf路径，未指定时取文档清单或`ARTICLE_PATH`下的所有pdf
+    :param config:
+    :param paths: 命令行指定的pdf路径
+    :return:
+    """
+    if paths:
+        yield from paths
+        return
+
+    if config.use_catalog:
+        from catalog import iter_catalog_paths
+        yield from iter_catalog_paths(config)
+        return
+
+    for file_name in sorted(os.listdir(config.article_path)):
+        if file_name.endswith('.pdf'):
+            yield '/'.join([config.article_path, file_name])
+
+
+def extract_toc(source, path, config: Config, toc_index=None):
+    from get_dicts import TextClassifier
+
+    obj = TextClassifier(source, config, path)
+    fpath = obj.save()
+    if toc_index is not None:
+        toc_index.add_tree(path, obj.tree)
+
+    return fpath
+
+
+def extract_figures(source, path, config: Config, toc_index=None):
+    from filter_images import TextClassifier
+
+    obj = TextClassifier(source, config, path)
+    obj.save()
+    return obj.stats
+
+
+TASKS = {
+    'toc': [extract_toc],
+    'figures': [extract_figures],
+    'both': [extract_toc, extract_figures],
+}
+
+# 各任务在耗时统计中的阶段名
+STAGES = {extract_toc: 'toc', extract_figures: 'figures'}
+
+
+def get_toc_index(config: Config):
+    from toc_index import TocIndex
+
+    return TocIndex(config.toc_index_path)
+
+
+def run_document(target, path, config: Config, toc_index=None):
+    """
+    对一篇文档执行`target`对应的所有任务
+    :param target: toc、figures或both
+    :param path: pdf路径
+    :param config:
+    :param toc_index: 目录索引，为None时不更新
+    :return: {任务名: 结果, 'seconds': {阶段（read、toc、figures）: 耗时}}
+    """
+    source, ret, seconds = path, dict(), dict()
+
+    # 多个任务时文件只读取一次
+    if len(TASKS[target]) > 1:
+        from documents import read_pdf
+        start = time.time()
+        source, path = read_pdf(path)
+        seconds['read'] = time.time() - start
+
+    for task in TASKS[target]:
+        start = time.time()
+        ret[task.__name__] = task(source, path, config, toc_index)
+        seconds[STAGES[task]] = time.time() - start
+
+    ret['seconds'] = seconds
+    return ret
@@ -2,7 +2,7 @@ import os
 import re
 import shutil
 
-from config import ARTICLE_PATH
+from config import Config
 from filter_images import TextClassifier, TITLE_COMPILE
 from log import get_logger
 
@@ -16,10 +16,6 @@ COMPILE = re.compile(r'([\u4e00-\u9fa5].*)')
 
 logger = get_logger(__name__)
 
-for p in [path_ok, path_problem]:
-    if not os.path.exists(p):
-        os.makedirs(p)
-
 
 def is_ok(fn_list):
     fn_list = sorted(fn_list)
@@ -32,6 +28,10 @@ def is_ok(fn_list):
 
 
 def classify():
+    for p in [path_ok, path_problem]:
+        if not os.path.exists(p):
+            os.makedirs(p)
+
     for d in os.listdir(path):
         t_list, img_list = [], []
         fp = path + '/' + d
@@ -72,7 +72,7 @@ def title_from_path(path):
 
 
 def find_no_title_article():
-    left_files = os.listdir(ARTICLE_PATH)
+    left_files = os.listdir(Config().article_path)
 
     for p in [path_ok, path_problem]:
         for handled_name in os.listdir(p):
@@ -83,9 +83,10 @@ def find_no_title_article():
     print(left_files)
     print(len(left_files))
     # for file_name in left_files:
-    #     fpath = ARTICLE_PATH + '/' + file_name
+    #     fpath = Config().article_path + '/' + file_name
     #     obj = TextClassifier(fpath)
     #     obj.save()
 
 
-classify()
+if __name__ == '__main__':
+    classify()
@@ -0,0 +1,69 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True, scope='session')
+def work_dir(tmp_path_factory):
+    """日志等相对路径写入临时目录，结束前写完日志队列中的记录"""
+    import log
+
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('work'))
+    yield
+    log.stop_listeners()
+    os.chdir(cwd)
+
+
+@pytest.fixture
+def figure_pdf(tmp_path):
+    """生成一页含嵌入图片及下标“图1”的pdf，返回(路径, 配置)"""
+    fitz = pytest.importorskip('fitz')
+    pytest.importorskip('pdfplumber')
+    from config import Config
+
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 40, 30), False)
+    pix.set_rect(pix.irect, (200, 30, 30))
+    page.insert_image(fitz.Rect(100, 200, 300, 350), pixmap=pix)
+    page.insert_text((100, 370), '图1 测试图片', fontname='china-s', fontsize=10)
+
+    article_path = tmp_path / 'articles'
+    article_path.mkdir()
+    path = str(article_path / '第1期 测试.pdf')
+    doc.save(path)
+    doc.close()
+
+    config = Config(
+        article_path=str(article_path), image_path=str(tmp_path / 'images'),
+        image_store_path=str(tmp_path / 'image_store.db'), page_cache_path=str(tmp_path / 'page_cache.db')
+    )
+    return path, config
+
+
+@pytest.fixture
+def toc_pdf(tmp_path):
+    """生成三页含文章标题、一级及二级标题、正文、页眉页码的pdf，返回路径"""
+    fitz = pytest.importorskip('fitz')
+    pytest.importorskip('pdfplumber')
+
+    doc = fitz.open()
+    for i in range(1, 4):
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((60, 40), '页眉 计算机学会通讯', fontname='china-s', fontsize=9)
+        if i == 1:
+            page.insert_text((60, 120), '测试文章标题', fontname='china-s', fontsize=28)
+        page.insert_text((60, 200), '{} 第{}节'.format(i, i), fontname='china-s', fontsize=16)
+        page.insert_text((60, 240), '正文内容第一段，字号较小。', fontname='china-s', fontsize=10)
+        page.insert_text((60, 280), '{}.1 小节'.format(i), fontname='china-s', fontsize=14)
+        page.insert_text((60, 320), '更多正文内容。', fontname='china-s', fontsize=10)
+        page.insert_text((60, 820), str(i), fontname='china-s', fontsize=9)
+
+    path = str(tmp_path / '第1期 测试文章.pdf')
+    doc.save(path)
+    doc.close()
+    return path
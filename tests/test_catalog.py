@@ -0,0 +1,21 @@
+from catalog import read_entry, resolve_title, title_from_path
+
+
+def test_title_from_path():
+    assert title_from_path('/archive/2017/第3期 互联网安全的忠诚卫士.pdf') == '第3期 互联网安全的忠诚卫士'
+    assert title_from_path('/archive/1607960556531098592.pdf') == '1607960556531098592'
+
+
+def test_resolve_title_keeps_file_name_title():
+    # 与原有结果一致：水印不改变标题，图表目录名不变
+    assert resolve_title('/archive/第3期 互联网安全的忠诚卫士.pdf', '互联网安全') == '第3期 互联网安全的忠诚卫士'
+    assert resolve_title('', '互联网安全') == '互联网安全'
+
+
+def test_catalog_title_matches_extractor(figure_pdf):
+    from filter_images import TextClassifier
+
+    path, config = figure_pdf
+    entry = read_entry(path)
+    assert entry['status'] == 'ok' and entry['pages'] == 1 and not entry['watermark']
+    assert entry['title'] == TextClassifier(path, config).title == '第1期 测试'
@@ -0,0 +1,39 @@
+import logging
+
+import cli
+import log
+from config import Config
+
+
+def test_status_counts_pdfs_recursively(tmp_path, capsys):
+    root = tmp_path / 'articles'
+    (root / 'issue1').mkdir(parents=True)
+    (root / 'a.pdf').write_bytes(b'%PDF')
+    (root / 'issue1' / 'b.pdf').write_bytes(b'%PDF')
+    results = tmp_path / 'results' / 'issue1'
+    results.mkdir(parents=True)
+    (results / 'b.json').write_text('{}', encoding='utf-8')
+
+    assert not cli.main([
+        '--articles', str(root), '--results', str(tmp_path / 'results'), '--jobs', str(tmp_path / 'jobs'), 'status'
+    ])
+    out = capsys.readouterr().out
+    assert 'pdf：2' in out
+    assert '已生成目录：1' in out
+
+
+def test_status_reports_missing_article_path(tmp_path, capsys):
+    assert cli.main(['--articles', str(tmp_path / 'missing'), 'status']) == 1
+    assert '不存在' in capsys.readouterr().out
+
+
+def test_log_setup_uses_config(tmp_path):
+    log_path, level = log._log_path, log._level
+    try:
+        log.setup(Config(log_path=str(tmp_path / 'logs'), log_level='DEBUG'))
+        assert log.get_log_file(log.LOGGER_PREFIX + 'jobs') == str(tmp_path / 'logs' / 'jobs.log')
+        assert log.get_log_file(log.EVENT_LOG_NAME) == str(tmp_path / 'logs' / 'events.jsonl')
+        assert log.get_logger('jobs').level == logging.DEBUG
+    finally:
+        log._log_path = log_path
+        log.set_level(level)
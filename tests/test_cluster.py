@@ -0,0 +1,61 @@
+import random
+
+from cluster import cluster_boxes, is_near, merge_box
+
+
+def brute_force(boxes, gap):
+    regions = [tuple(b) for b in boxes]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                if is_near(regions[i], regions[j], gap):
+                    regions[i] = merge_box(regions[i], regions[j])
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    return sorted(regions)
+
+
+def test_gap_threshold():
+    assert cluster_boxes([(0, 0, 10, 10), (60, 0, 70, 10)], 50) == [(0, 0, 70, 10)]
+    assert cluster_boxes([(0, 0, 10, 10), (61, 0, 71, 10)], 50) == [(0, 0, 10, 10), (61, 0, 71, 10)]
+    # 水平、竖直方向都需在间隔内
+    assert len(cluster_boxes([(0, 0, 10, 10), (20, 100, 30, 110)], 50)) == 2
+
+
+def test_transitive_merge():
+    boxes = [(0, 0, 10, 10), (40, 0, 50, 10), (80, 0, 90, 10), (120, 0, 130, 10)]
+    assert cluster_boxes(boxes, 30) == [(0, 0, 130, 10)]
+
+
+def test_merge_with_region_left_behind_by_sweep():
+    # 右侧的竖条并入底部横条后，区域向上扩大，才与左上角已移出扫描范围的矩形相邻
+    boxes = [(0, 0, 10, 10), (15, 200, 300, 210), (290, 15, 300, 200)]
+    assert cluster_boxes(boxes, 10) == brute_force(boxes, 10) == [(0, 0, 300, 210)]
+
+
+def test_caption_blocks_merge():
+    caption = (0, 45, 20, 55)
+
+    def is_blocked(box):
+        return box[1] <= caption[1] and caption[3] <= box[3]
+
+    boxes = [(0, 0, 100, 40), (0, 60, 100, 100)]
+    assert cluster_boxes(boxes, 30, is_blocked) == sorted(boxes)
+    assert cluster_boxes(boxes, 30) == [(0, 0, 100, 100)]
+
+
+def test_matches_brute_force():
+    rnd = random.Random(7)
+    for _ in range(200):
+        boxes = []
+        for _ in range(rnd.randint(1, 25)):
+            x, y = rnd.uniform(0, 500), rnd.uniform(0, 700)
+            boxes.append((x, y, x + rnd.uniform(0, 80), y + rnd.uniform(0, 80)))
+
+        assert cluster_boxes(boxes, 20) == brute_force(boxes, 20)
@@ -0,0 +1,163 @@
+import os
+import shutil
+
+import pytest
+
+from config import Config
+from filter_images import TextClassifier
+from image_store import ImageStore
+
+
+def saved_files(config):
+    return sorted(f for _, _, files in os.walk(config.image_path) for f in files if f.endswith('.png'))
+
+
+def test_rerun_after_clearing_output_saves_again(figure_pdf):
+    path, config = figure_pdf
+    config.use_page_cache = False
+
+    first = TextClassifier(path, config)
+    first.save()
+    assert first.stats['status'] == 'ok'
+    assert saved_files(config) == ['图1 测试图片.png']
+
+    shutil.rmtree(first.save_path)
+
+    second = TextClassifier(path, config)
+    second.save()
+    assert second.stats['references'] == 0
+    assert second.stats['images'] == 1
+    assert saved_files(config) == ['图1 测试图片.png']
+
+    store = ImageStore(config.image_store_path)
+    paths = [row[0] for row in store.conn.execute('SELECT path FROM images')]
+    store.close()
+    assert paths and all(os.path.exists(p) for p in paths)
+
+
+def test_repeated_figure_becomes_reference(figure_pdf):
+    path, config = figure_pdf
+    config.use_page_cache = False
+
+    TextClassifier(path, config).save()
+    second = TextClassifier(path, config, name=path.replace('第1期', '第2期'))
+    second.save()
+    assert second.stats['images'] == 0
+    assert second.stats['references'] == 1
+
+
+def test_page_cache_replays_figures(figure_pdf):
+    path, config = figure_pdf
+
+    first = TextClassifier(path, config)
+    first.save()
+    second = TextClassifier(path, config)
+    second.save()
+
+    assert first.stats['cached_pages'] == 0
+    assert second.stats['cached_pages'] == 1
+    assert second.stats['references'] == 1
+    assert saved_files(config) == ['图1 测试图片.png']
+
+
+def test_degraded_pages_are_not_cached(figure_pdf):
+    path, config = figure_pdf
+    config.max_page_objects = -1
+
+    first = TextClassifier(path, config)
+    first.save()
+    second = TextClassifier(path, config)
+    second.save()
+
+    assert first.stats['degraded_pages'] == 1
+    assert second.stats['cached_pages'] == 0
+
+
+def test_page_without_figures_is_cached_as_empty(tmp_path):
+    fitz = pytest.importorskip('fitz')
+    pytest.importorskip('pdfplumber')
+
+    doc = fitz.open()
+    doc.new_page(width=595, height=842).insert_text((100, 300), 'plain text only', fontsize=10)
+    path = str(tmp_path / 'plain.pdf')
+    doc.save(path)
+
+    config = Config(
+        article_path=str(tmp_path), image_path=str(tmp_path / 'images'),
+        image_store_path=str(tmp_path / 'image_store.db'), page_cache_path=str(tmp_path / 'page_cache.db')
+    )
+    TextClassifier(path, config).save()
+    second = TextClassifier(path, config)
+    second.save()
+
+    assert second.stats['cached_pages'] == 1
+    assert second.stats['images'] == 0 and second.stats['references'] == 0
+
+
+def test_subscript_boxes_need_caption_char():
+    from types import SimpleNamespace
+
+    def char(text, x0):
+        return dict(text=text, x0=x0, x1=x0 + 10, top=100, bottom=110)
+
+    page = SimpleNamespace(chars=[char('', 0), char('1', 10), char('图', 20), char('2', 30), char('表', 40)])
+    assert TextClassifier.get_subscript_boxes(page) == [(20, 100, 40, 110)]
+
+
+
+def figure_page(fitz, diagonal=False):
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 40, 30), False)
+    for x in range(40):
+        for y in range(30):
+            pix.set_pixel(x, y, (x * 6, y * 8, 100))
+    page.insert_image(fitz.Rect(100.3, 200.2, 300.7, 350.1), pixmap=pix)
+    page.draw_rect(fitz.Rect(420.5, 650.2, 590.3, 830.6), color=(1, 0, 0), fill=(0, 0, 1), width=1.3)
+    page.insert_text((60, 80), '图1 测试图片', fontname='china-s', fontsize=17)
+    if diagonal:
+        for i in range(0, 595, 37):
+            page.draw_line((i, 0), (595 - i, 842), color=(i / 595, 0.2, 0.6), width=1.3)
+    return doc, page
+
+
+CLIPS = [
+    (100, 200, 300, 350),
+    # 超出页面右下、左上边缘，坐标含小数
+    (450.3, 700.7, 700, 900),
+    (-20, -10.5, 120.2, 80),
+    (500, 100, 800, 300),
+]
+
+
+@pytest.mark.parametrize('zoom', [1, 2, 1.5])
+@pytest.mark.parametrize('clip', CLIPS)
+def test_crop_pixmap_matches_clip_render(zoom, clip):
+    fitz = pytest.importorskip('fitz')
+    from image_store import pixel_digest
+
+    doc, page = figure_page(fitz)
+    mat = fitz.Matrix(zoom, zoom)
+    clip = fitz.Rect(*clip)
+    cropped = TextClassifier.crop_pixmap(page, page.get_pixmap(matrix=mat, alpha=False), clip, mat)
+    expected = page.get_pixmap(matrix=mat, alpha=False, clip=clip)
+
+    assert (cropped.width, cropped.height) == (expected.width, expected.height)
+    assert pixel_digest(cropped) == pixel_digest(expected)
+    doc.close()
+
+
+@pytest.mark.parametrize('clip', CLIPS)
+def test_crop_pixmap_diagonal_strokes(clip):
+    fitz = pytest.importorskip('fitz')
+
+    # 斜线按区域渲染时抗锯齿结果略有不同，只要求尺寸一致、像素相差很小
+    doc, page = figure_page(fitz, diagonal=True)
+    mat = fitz.Matrix(2, 2)
+    clip = fitz.Rect(*clip)
+    cropped = TextClassifier.crop_pixmap(page, page.get_pixmap(matrix=mat, alpha=False), clip, mat)
+    expected = page.get_pixmap(matrix=mat, alpha=False, clip=clip)
+
+    assert (cropped.irect, cropped.n) == (expected.irect, expected.n)
+    assert max(abs(a - b) for a, b in zip(cropped.samples, expected.samples)) <= 32
+    doc.close()
@@ -0,0 +1,185 @@
+import pytest
+
+from get_dicts import TextClassifier
+
+
+def run(text, size=16):
+    return dict(text=text, size=size)
+
+
+def test_outline_item_requires_title_in_run():
+    match = TextClassifier.match_outline_item
+
+    # 较短的标题字号文本不能作为任意书签的依据
+    assert match('1 引言', [run('1')]) is None
+    assert match('研究背景与意义', [run('研')]) is None
+    # 非标题字号不匹配
+    assert match('引言', [run('1引言', size=10)]) is None
+
+    assert match('引言', [run('1'), run('1引言')]) == run('1引言')
+    assert match('大规模图计算系统综述', [run('大规模图计算系统综')]) == run('大规模图计算系统综')
+
+
+def dump_tree(classifier):
+    import io
+
+    f = io.StringIO()
+    classifier.tree.dump_json(f)
+    return f.getvalue()
+
+
+def test_toc_page_cache_replays_headings(toc_pdf, tmp_path):
+    from config import Config
+
+    config = Config(use_outline=False, toc_page_cache=True, page_cache_path=str(tmp_path / 'cache.db'))
+
+    first = TextClassifier(toc_pdf, config)
+    first.classify()
+    second = TextClassifier(toc_pdf, config)
+    second.classify()
+
+    assert first.cache_stats['cached_pages'] == 0
+    assert second.cache_stats['cached_pages'] == 3
+    assert dump_tree(second) == dump_tree(first)
+
+    uncached = TextClassifier(toc_pdf, Config(use_outline=False))
+    uncached.classify()
+    assert dump_tree(uncached) == dump_tree(first)
+
+
+def test_toc_page_cache_is_off_by_default(toc_pdf, tmp_path):
+    from config import Config
+
+    config = Config(use_outline=False, page_cache_path=str(tmp_path / 'cache.db'))
+    TextClassifier(toc_pdf, config).classify()
+    assert not (tmp_path / 'cache.db').exists()
+
+
+def read_sections(fpath):
+    import json
+
+    with open(fpath, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_exported_sections_keep_all_body_text(tmp_path):
+    fitz = pytest.importorskip('fitz')
+    pytest.importorskip('pdfplumber')
+    from config import Config
+
+    doc = fitz.open()
+    for i in range(1, 3):
+        page = doc.new_page(width=595, height=842)
+        if i == 1:
+            page.insert_text((60, 120), '测试文章标题', fontname='china-s', fontsize=28)
+            page.insert_text((60, 200), '1 引言', fontname='china-s', fontsize=16)
+        # 段落中只有一个字符字号不同
+        page.insert_text((60, 240), '甲乙', fontname='china-s', fontsize=10)
+        page.insert_text((80, 240), '丙', fontname='china-s', fontsize=12)
+        page.insert_text((92, 240), '丁戊', fontname='china-s', fontsize=10)
+        page.insert_text((60, 260), '己庚', fontname='china-s', fontsize=10)
+    path = str(tmp_path / 's.pdf')
+    doc.save(path)
+
+    config = Config(export_sections=True, section_path=str(tmp_path / 'sections'), result_path=str(tmp_path))
+    TextClassifier(path, config).save()
+
+    sections = read_sections(tmp_path / 'sections' / 's.jsonl')
+    assert len(sections) == 1
+    assert sections[0]['path'] == ['测试文章标题', '1 引言']
+    assert (sections[0]['page_start'], sections[0]['page_end']) == (1, 2)
+    assert sections[0]['text'] == '甲乙丙丁戊\n己庚\n甲乙丙丁戊\n己庚'
+
+
+def test_exporting_sections_keeps_headings(toc_pdf, tmp_path):
+    from config import Config
+
+    plain = TextClassifier(toc_pdf, Config(use_outline=False, pre_filter_chars=False))
+    plain.classify()
+    exported = TextClassifier(toc_pdf, Config(export_sections=True, section_path=str(tmp_path / 'sections')))
+    exported.classify()
+    assert dump_tree(exported) == dump_tree(plain)
+
+    sections = read_sections(tmp_path / 'sections' / '第1期 测试文章.jsonl')
+    assert [s['path'][-1] for s in sections] == ['1 第1节', '1.1 小节', '2 第2节', '2.1 小节', '3 第3节', '3.1 小节']
+    assert sections[0]['text'] == '正文内容第一段，字号较小。'
+    assert sections[1]['text'].startswith('更多正文内容。')
+
+
+BODY_FONT = 'ABCDEF+FZLTHK--GBK1-0'
+EXCLUDED_FONT = 'ABCDEF+FZSSK--GBK1-0'
+
+
+def line(text, size, top, fontname=BODY_FONT, page_number=1):
+    return [
+        dict(text=ch, size=size, fontname=fontname, x0=60 + i * size, x1=60 + (i + 1) * size, top=top,
+             bottom=top + size, page_number=page_number)
+        for i, ch in enumerate(text)
+    ]
+
+
+def fake_page(chars, height=842):
+    from types import SimpleNamespace
+
+    return SimpleNamespace(chars=chars, height=height, page_number=1)
+
+
+def texts(segments):
+    return [''.join(c['text'] for c in seg) for seg in segments]
+
+
+def test_char_filter_split():
+    from get_dicts import CharFilter
+
+    chars = (
+        line('期刊名称', 16, 20) + line('1 引言', 16, 100) + line('正文', 10, 130) + line('1.1 背景', 14, 160)
+        + line('方正书宋', 16, 200, EXCLUDED_FONT) + line('三级', 11, 240) + line('说明', 10.4, 260)
+        + line('页码', 16, 800)
+    )
+    segments = CharFilter().split(chars)
+
+    # 字号小于三级标题、排除字体的字符被过滤，隔开多个字符的片段不合并；
+    # 以页眉开始的同字号文本段整段过滤，页脚与逐字符分析一致，不过滤
+    assert texts(segments) == ['1.1 背景', '三级', '页码']
+
+
+def test_char_filter_excluded_words():
+    from get_dicts import CharFilter
+
+    char_filter = CharFilter()
+    assert char_filter.has_excluded_word('特邀作者张为华')
+    assert not char_filter.has_excluded_word('1 引言')
+
+
+def classify_page(chars, pre_filter):
+    from config import Config
+
+    classifier = TextClassifier(b'%PDF', Config(pre_filter_chars=pre_filter), name='synthetic.pdf')
+    for count, attr_list in classifier.iter_page_runs(fake_page(chars)):
+        classifier.handle_text(count, attr_list)
+    return dump_tree(classifier)
+
+
+def test_pre_filter_matches_unfiltered_toc():
+    chars = (
+        line('期刊名称', 28, 20) + line('测试文章标题', 28, 80) + line('作者', 10, 120)
+        + line('1 引言', 16, 150) + line('正文第一段', 10, 180) + line('1.1 背', 14, 210) + line('景', 14, 210)
+        + line('正文', 10, 240) + line('第二段', 9, 260) + line('2 方法', 16, 300) + line('2.1 数据', 14, 330)
+        + line('2.1.1 采集', 11, 360) + line('正文', 10, 390) + line('图1', 9, 420) + line('3', 10, 810)
+        + line('附注', 10, 780) + line('页脚标题', 16, 800)
+    )
+
+    filtered = classify_page(chars, True)
+    assert filtered == classify_page(chars, False)
+    assert '2.1.1 采集' in filtered and '1.1 背景' in filtered
+
+
+def test_pre_filter_drops_excluded_words_and_fonts():
+    chars = (
+        line('测试文章标题', 28, 80) + line('1 引言', 16, 150) + line('正文', 10, 180)
+        + line('张为华', 16, 210) + line('正文', 10, 240) + line('方正书宋', 16, 270, EXCLUDED_FONT)
+    )
+
+    filtered = classify_page(chars, True)
+    assert '张为华' not in filtered and '方正书宋' not in filtered
+    assert '张为华' in classify_page(chars, False)
@@ -0,0 +1,13 @@
+from image_store import ImageStore
+
+
+def test_remove_path_drops_references(tmp_path):
+    store = ImageStore(str(tmp_path / 'store.db'))
+    store.add('/images/a.png', render_key='abc', width=10, height=10)
+    store.add_reference('doc.pdf', '图1', '/images/a.png', 'abc')
+
+    assert store.find_render('abc') == '/images/a.png'
+
+    store.remove_path('/images/a.png')
+    assert store.find_render('abc') is None
+    assert store.conn.execute('SELECT COUNT(*) FROM refs').fetchone()[0] == 0
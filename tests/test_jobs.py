@@ -0,0 +1,185 @@
+import json
+import multiprocessing
+import os
+import signal
+import time
+
+import pytest
+
+import jobs
+import tasks
+from config import Config
+from jobs import JobTable
+
+
+def make_table(job_path, owner, ttl=300):
+    table = JobTable(str(job_path), ttl)
+    table.owner = owner
+    return table
+
+
+def write_stale_lease(table, path, owner='ghost-host:1', age=1000):
+    lease = table.job_file(path, '.lease')
+    with open(lease, 'w', encoding='utf-8') as f:
+        json.dump(dict(owner=owner, path=path, time=time.time() - age), f)
+    os.utime(lease, (time.time() - age, time.time() - age))
+    return lease
+
+
+def test_takeover_race_keeps_single_owner(tmp_path, monkeypatch):
+    a = make_table(tmp_path, 'host-a:1', ttl=60)
+    b = make_table(tmp_path, 'host-b:1', ttl=60)
+    path = '/archive/a.pdf'
+    write_stale_lease(a, path)
+
+    # b判断租约过期之后、移走租约之前，a先接管并创建了新租约
+    is_expired = JobTable.is_expired
+
+    def slow_is_expired(self, info):
+        ret = is_expired(self, info)
+        assert a.claim(path)
+        return ret
+
+    monkeypatch.setattr(b, 'is_expired', slow_is_expired.__get__(b))
+
+    assert not b.claim(path)
+    assert a.renew(path)
+    assert a.owns(path) and not b.owns(path)
+
+
+def test_release_and_complete_check_owner(tmp_path):
+    a = make_table(tmp_path, 'host-a:1')
+    b = make_table(tmp_path, 'host-b:1')
+    path = '/archive/a.pdf'
+
+    assert a.claim(path)
+    assert not b.release(path)
+    assert not b.complete(path)
+    assert a.owns(path) and not a.is_done(path)
+
+    assert a.complete(path)
+    assert a.is_done(path) and not os.path.exists(a.job_file(path, '.lease'))
+
+
+def fake_run_document(target, path, config, toc_index=None):
+    with open(os.path.join(config.result_path, 'processed.log'), 'a', encoding='utf-8') as f:
+        f.write('{}\n'.format(path))
+    time.sleep(0.01)
+    return {'seconds': {}}
+
+
+def run_node(config, root):
+    jobs.node_main('figures', config, root, recycle=False)
+
+
+@pytest.mark.parametrize('nodes', [4])
+def test_nodes_process_each_document_once(tmp_path, monkeypatch, nodes):
+    monkeypatch.setattr(tasks, 'run_document', fake_run_document)
+
+    root = tmp_path / 'archive'
+    paths = []
+    for issue in range(3):
+        (root / 'issue{}'.format(issue)).mkdir(parents=True)
+        for i in range(10):
+            p = root / 'issue{}'.format(issue) / '{}.pdf'.format(i)
+            p.write_bytes(b'%PDF')
+            paths.append(str(p))
+
+    config = Config(
+        job_path=str(tmp_path / 'jobs'), result_path=str(tmp_path), metrics_path='', update_toc_index=False,
+        use_catalog=False, lease_ttl=1, worker_max_docs=0
+    )
+
+    # 部分文档留有已过期的租约，只能被一个节点接管
+    table = JobTable(config.job_path, config.lease_ttl, str(root))
+    for p in paths[::3]:
+        write_stale_lease(table, p)
+
+    ctx = multiprocessing.get_context('fork')
+    processes = [ctx.Process(target=run_node, args=(config, str(root))) for _ in range(nodes)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join(60)
+        assert p.exitcode == 0
+
+    with open(tmp_path / 'processed.log', encoding='utf-8') as f:
+        processed = f.read().split()
+
+    assert sorted(processed) == sorted(paths)
+    assert all(table.is_done(p) for p in paths)
+
+
+def test_job_key_is_relative_to_root(tmp_path):
+    a = JobTable(str(tmp_path), root='/mnt/share/archive')
+    b = JobTable(str(tmp_path), root='/data/archive')
+
+    assert a.job_key('/mnt/share/archive/issue1/a.pdf') == 'issue1/a.pdf'
+    assert a.job_file('/mnt/share/archive/issue1/a.pdf', '.lease') == b.job_file('/data/archive/issue1/a.pdf', '.lease')
+
+
+def test_outputs_keep_relative_subdirectory():
+    config = Config(article_path='/archive')
+
+    assert config.relative_dir('/archive/issue1/a.pdf') == 'issue1'
+    assert config.relative_dir('/archive/a.pdf') == ''
+    assert config.relative_dir('/elsewhere/a.pdf') == ''
+
+
+def test_errors_are_retried_then_quarantined(tmp_path, monkeypatch):
+    calls = []
+
+    def failing_run_document(target, path, config, toc_index=None):
+        calls.append(path)
+        raise ValueError('bad pdf')
+
+    monkeypatch.setattr(tasks, 'run_document', failing_run_document)
+
+    root = tmp_path / 'archive'
+    root.mkdir()
+    (root / 'bad.pdf').write_bytes(b'%PDF')
+    config = Config(
+        job_path=str(tmp_path / 'jobs'), metrics_path='', update_toc_index=False, use_catalog=False,
+        lease_ttl=0.03, max_retries=1, workers=1
+    )
+
+    summary = jobs.run_distributed('figures', config, str(root))
+
+    table = JobTable(config.job_path, config.lease_ttl, str(root), config.max_retries)
+    path = str(root / 'bad.pdf')
+    assert calls == [path, path]
+    assert summary['errors'] == 2
+    assert table.is_quarantined(path) and not table.claim(path)
+
+
+def crashing_run_document(target, path, config, toc_index=None):
+    if path.endswith('bad.pdf'):
+        os.kill(os.getpid(), signal.SIGKILL)
+    return fake_run_document(target, path, config, toc_index)
+
+
+def test_crashed_nodes_are_respawned_and_bad_document_quarantined(tmp_path, monkeypatch):
+    monkeypatch.setattr(tasks, 'run_document', crashing_run_document)
+
+    root = tmp_path / 'archive'
+    root.mkdir()
+    paths = [str(root / '{}.pdf'.format(i)) for i in range(6)] + [str(root / 'bad.pdf')]
+    for p in paths:
+        with open(p, 'wb') as f:
+            f.write(b'%PDF')
+
+    config = Config(
+        job_path=str(tmp_path / 'jobs'), result_path=str(tmp_path), metrics_path='', update_toc_index=False,
+        use_catalog=False, lease_ttl=0.3, max_retries=1, workers=2, worker_max_docs=0
+    )
+
+    jobs.run_distributed('figures', config, str(root))
+
+    table = JobTable(config.job_path, config.lease_ttl, str(root), config.max_retries)
+    with open(tmp_path / 'processed.log', encoding='utf-8') as f:
+        processed = f.read().split()
+
+    assert sorted(processed) == sorted(paths[:-1])
+    assert all(table.is_done(p) for p in paths[:-1])
+    assert table.is_quarantined(paths[-1])
+    assert table.failed_attempts(paths[-1]) == 2
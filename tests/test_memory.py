@@ -0,0 +1,74 @@
+import sys
+import types
+
+import memory
+from config import Config
+from memory import MemoryGovernor, get_fitz_store_size, shrink_fitz_store
+
+
+def make_governor(**kwargs):
+    kwargs.setdefault('snapshot_every', 0)
+    kwargs.setdefault('shrink_every', 0)
+    kwargs.setdefault('worker_max_rss', 0)
+    return MemoryGovernor(Config(**kwargs))
+
+
+def test_recycle_after_max_docs():
+    governor = make_governor(worker_max_docs=2)
+    governor.after_document()
+    assert not governor.should_recycle()
+    governor.after_document()
+    assert governor.should_recycle()
+
+
+def test_recycle_on_rss(monkeypatch):
+    governor = make_governor(worker_max_docs=0, worker_max_rss=1000)
+    monkeypatch.setattr(memory, 'get_rss', lambda: 999)
+    assert not governor.should_recycle()
+    monkeypatch.setattr(memory, 'get_rss', lambda: 1000)
+    assert governor.should_recycle()
+
+
+def test_no_limits_never_recycles():
+    governor = make_governor(worker_max_docs=0)
+    for _ in range(5):
+        governor.after_document()
+    assert not governor.should_recycle()
+
+
+class FakeTools(object):
+    def __init__(self, size, as_method):
+        self.size = size
+        self.shrunk = []
+        self.as_method = as_method
+
+    @property
+    def store_size(self):
+        return (lambda: self.size) if self.as_method else self.size
+
+    def store_shrink(self, percent):
+        self.shrunk.append(percent)
+        if self.size is not None:
+            self.size = int(self.size * (100 - percent) / 100)
+        return self.size
+
+
+def test_shrink_store_with_size(monkeypatch):
+    tools = FakeTools(1000, as_method=False)
+    monkeypatch.setitem(sys.modules, 'fitz', types.SimpleNamespace(TOOLS=tools))
+
+    assert shrink_fitz_store(2000) == 1000
+    assert tools.shrunk == []
+    assert shrink_fitz_store(500) <= 500
+    assert shrink_fitz_store(0) == 0
+
+
+def test_shrink_store_without_size(monkeypatch):
+    tools = FakeTools(None, as_method=True)
+    monkeypatch.setitem(sys.modules, 'fitz', types.SimpleNamespace(TOOLS=tools))
+
+    assert get_fitz_store_size() is None
+    shrink_fitz_store(500)
+    assert tools.shrunk == []
+    shrink_fitz_store(0)
+    assert tools.shrunk == [100]
@@ -0,0 +1,25 @@
+import socket
+
+from metrics import Exporter, Metrics
+
+
+def test_exporter_survives_port_in_use(tmp_path):
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen()
+    port = sock.getsockname()[1]
+    try:
+        exporter = Exporter(Metrics(), str(tmp_path / 'extract.prom'), port=port)
+        assert exporter.server is None
+        exporter.stop()
+    finally:
+        sock.close()
+
+
+def test_record_document_observes_figure_stages():
+    metrics = Metrics()
+    stats = dict(status='ok', pages=2, images=1, deleted=0, references=0, stages=dict(tables=0.5, render=0.2))
+    metrics.record_document({'extract_figures': stats, 'seconds': {'read': 0.1, 'figures': 1.0}})
+    text = metrics.render()
+    for stage in ('read', 'figures', 'tables', 'render'):
+        assert 'stage="{}"'.format(stage) in text
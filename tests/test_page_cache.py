@@ -0,0 +1,57 @@
+import pytest
+
+from page_cache import SUBSET_COMPILE, PageCache, get_kind, page_fingerprint
+
+fitz = pytest.importorskip('fitz')
+
+
+def make_page(doc, text, image_color=None):
+    page = doc.new_page(width=300, height=300)
+    page.insert_text((20, 50), text, fontname='helv', fontsize=12)
+    if image_color is not None:
+        pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 8, 8), False)
+        pix.set_rect(pix.irect, image_color)
+        page.insert_image(fitz.Rect(20, 100, 120, 200), pixmap=pix)
+    return page
+
+
+def test_fingerprint_is_stable_across_documents():
+    a, b = fitz.open(), fitz.open()
+    make_page(a, 'other page')
+    make_page(a, 'advertisement', (255, 0, 0))
+    make_page(b, 'advertisement', (255, 0, 0))
+
+    assert page_fingerprint(a[1]) == page_fingerprint(b[0])
+    assert page_fingerprint(a[1]) == page_fingerprint(a[1])
+
+
+def test_fingerprint_changes_with_text_and_images():
+    doc = fitz.open()
+    make_page(doc, 'advertisement', (255, 0, 0))
+    make_page(doc, 'advertisement!', (255, 0, 0))
+    make_page(doc, 'advertisement', (0, 0, 255))
+
+    keys = {page_fingerprint(page) for page in doc}
+    assert len(keys) == 3
+
+
+def test_subset_prefix_is_ignored():
+    assert SUBSET_COMPILE.sub('', 'ABCDEF+FZSSK--GBK1-0') == SUBSET_COMPILE.sub('', 'QWERTY+FZSSK--GBK1-0')
+
+
+def test_get_put_and_kinds(tmp_path):
+    kind, other_kind = get_kind('figures', 60, True), get_kind('figures', 60, False)
+    assert kind != other_kind
+
+    with PageCache(str(tmp_path / 'cache.db')) as cache:
+        assert cache.get('page', kind) is None
+
+        # 没有图表的页面缓存为空列表，与未缓存（None）区分
+        cache.put('page', kind, [])
+        assert cache.get('page', kind) == []
+        assert cache.get('page', other_kind) is None
+
+        # 已存在时不覆盖
+        cache.put('page', kind, [['图1', [0, 0, 1, 1], 'a.png']])
+        assert cache.get('page', kind) == []
+        assert cache.conn.execute('SELECT hits FROM pages').fetchone()[0] == 2
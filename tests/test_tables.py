@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+import pytest
+
+from tables import find_table_boxes, iou, snap_segments
+
+
+def h_edge(top, x0, x1):
+    return dict(top=top, bottom=top, x0=x0, x1=x1)
+
+
+def v_edge(x, top, bottom):
+    return dict(top=top, bottom=bottom, x0=x, x1=x)
+
+
+def grid(x0, top, x1, bottom, rows=2, cols=2):
+    """(x0, top, x1, bottom)内rows行cols列的表格线"""
+    ys = [top + (bottom - top) * i / rows for i in range(rows + 1)]
+    xs = [x0 + (x1 - x0) * i / cols for i in range(cols + 1)]
+    return [h_edge(y, x0, x1) for y in ys], [v_edge(x, top, bottom) for x in xs]
+
+
+def fake_page(h_edges, v_edges):
+    return SimpleNamespace(horizontal_edges=h_edges, vertical_edges=v_edges)
+
+
+def test_snap_segments():
+    # 坐标相差不超过容差的线段对齐，首尾相近的合并，间隔较大的保留为两段
+    assert snap_segments([(100, 0, 50), (102, 52, 100), (200, 0, 10), (200, 20, 30)], 3, 3) == [
+        (101, 0, 100), (200, 0, 10), (200, 20, 30)
+    ]
+
+
+def test_find_table_boxes_on_grid():
+    h_edges, v_edges = grid(50, 100, 300, 200, rows=3, cols=4)
+    assert find_table_boxes(fake_page(h_edges, v_edges)) == [(50, 100, 300, 200)]
+
+
+def test_find_table_boxes_snaps_and_joins():
+    # 断开、错位不超过容差的表格线仍识别为一个表格
+    h_edges = [h_edge(100, 50, 170), h_edge(101.5, 172, 300), h_edge(200, 50, 300)]
+    v_edges = [v_edge(50, 100, 200), v_edge(298, 99, 201)]
+    boxes = find_table_boxes(fake_page(h_edges, v_edges))
+    assert len(boxes) == 1
+    assert iou(boxes[0], (50, 100, 300, 200)) > 0.95
+
+
+def test_find_table_boxes_separate_tables():
+    h1, v1 = grid(50, 100, 300, 200)
+    h2, v2 = grid(50, 400, 300, 500)
+    assert find_table_boxes(fake_page(h1 + h2, v1 + v2)) == [(50, 100, 300, 200), (50, 400, 300, 500)]
+
+
+def test_find_table_boxes_ignores_lone_rules():
+    # 只有横线（如三线表的分隔线、下划线）或只有一条竖线时不构成表格
+    assert find_table_boxes(fake_page([h_edge(100, 50, 300), h_edge(200, 50, 300)], [])) == []
+    assert find_table_boxes(fake_page(
+        [h_edge(100, 50, 300), h_edge(200, 50, 300)], [v_edge(50, 100, 200)]
+    )) == []
+    # 过短的线段忽略
+    assert find_table_boxes(fake_page(
+        [h_edge(100, 50, 300), h_edge(200, 50, 300)], [v_edge(50, 100, 101), v_edge(300, 199, 200.5)]
+    )) == []
+
+
+def test_find_table_boxes_matches_pdfplumber(tmp_path):
+    fitz = pytest.importorskip('fitz')
+    pdfplumber = pytest.importorskip('pdfplumber')
+
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    for y in (100, 130, 160, 190):
+        page.draw_line((60, y), (400, y))
+    for x in (60, 200, 400):
+        page.draw_line((x, 100), (x, 190))
+    path = str(tmp_path / 'table.pdf')
+    doc.save(path)
+    doc.close()
+
+    with pdfplumber.open(path) as pdf:
+        page = pdf.pages[0]
+        expected = [t.bbox for t in page.find_tables()]
+        found = find_table_boxes(page)
+
+    assert len(found) == len(expected) == 1
+    assert iou(found[0], expected[0]) > 0.95
@@ -0,0 +1,20 @@
+from toc_index import TocIndex, tokenize
+from tree import Node, Tree
+
+
+def test_tokenize():
+    assert tokenize('图计算 GPU') == ['图', '计', '算', '图计', '计算', 'gpu']
+    assert tokenize('图计算 GPU', for_query=True) == ['图计', '计算', 'gpu']
+
+
+def test_single_character_query(tmp_path):
+    root = Node(text='文章', level=0, page_number=1)
+    root.children.append(Node(text='大规模图计算', level=1, page_number=1))
+    root.children.append(Node(text='引言', level=1, page_number=2))
+
+    with TocIndex(str(tmp_path / 'index.db')) as toc_index:
+        toc_index.add_tree('/archive/a.pdf', Tree(root))
+
+        assert [r['path'] for r in toc_index.search('图')] == ['大规模图计算']
+        assert len(toc_index.search('图计算')) == 1
+        assert toc_index.search('图 引言') == []
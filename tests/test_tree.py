@@ -0,0 +1,81 @@
+import io
+import json
+
+from tree import Node, Tree
+
+
+def build_tree():
+    root = Node(text='root')
+    tree = Tree(root)
+    a, b = Node(text='a'), Node(text='b')
+    tree.insert(root, a)
+    tree.insert(a, b)
+    return tree, a, b
+
+
+def test_find_path_follows_parents(monkeypatch):
+    tree, a, b = build_tree()
+    monkeypatch.setattr(Tree, 'iter_paths', lambda *args, **kwargs: iter(()))
+    assert tree.find_path(b) == ('root', 'a', 'b')
+    assert tree.find_path(tree.root) == ('root',)
+
+
+def test_find_path_falls_back_without_parent():
+    tree, a, b = build_tree()
+    c = Node(text='c')
+    b.children.append(c)
+    assert tree.find_path(c) == ('root', 'a', 'b', 'c')
+
+
+def build_outline():
+    # 同名兄弟结点及空结点（无属性）都需原样保留
+    root = Node(text='论文', level=0, page_number=1)
+    tree = Tree(root)
+    for title in ('1 引言', '1 引言'):
+        node = Node(text=title, level=1, page_number=2)
+        tree.insert(root, node)
+        tree.insert(node, Node(text='1.1 背景', level=2, page_number=3))
+    tree.insert(root, Node())
+    return tree
+
+
+def to_dict(node, attrs=('text', 'level', 'page_number')):
+    res = {k: getattr(node, k, None) for k in attrs}
+    res['children'] = [to_dict(ch, attrs) for ch in node.children]
+    return res
+
+
+def test_dump_json_round_trip():
+    tree = build_outline()
+    fp = io.StringIO()
+    tree.dump_json(fp)
+
+    data = json.loads(fp.getvalue())
+    assert data == to_dict(tree.root)
+    assert [ch['text'] for ch in data['children']] == ['1 引言', '1 引言', None]
+
+
+def test_dump_json_without_attrs():
+    fp = io.StringIO()
+    build_outline().dump_json(fp, attrs=())
+    assert json.loads(fp.getvalue())['children'][0] == {'children': [{'children': []}]}
+
+
+def test_dump_jsonl_round_trip():
+    tree = build_outline()
+    fp = io.StringIO()
+    tree.dump_jsonl(fp)
+
+    records = [json.loads(line) for line in fp.getvalue().splitlines()]
+    assert [r['id'] for r in records] == list(range(6))
+    assert [(r['text'], r['parent'], r['depth']) for r in records] == [
+        ('论文', None, 0), ('1 引言', 0, 1), ('1.1 背景', 1, 2), ('1 引言', 0, 1), ('1.1 背景', 3, 2), (None, 0, 1),
+    ]
+
+    # 按parent重建后与原树一致
+    nodes = {}
+    for r in records:
+        nodes[r['id']] = dict({k: r[k] for k in ('text', 'level', 'page_number')}, children=[])
+        if r['parent'] is not None:
+            nodes[r['parent']]['children'].append(nodes[r['id']])
+    assert nodes[0] == to_dict(tree.root)
@@ -0,0 +1,196 @@
+"""
+目录倒排索引：以标题中的词为键，记录其所在文档、标题路径、层级及页码。
+中文按相邻两字切分，英文、数字按单词切分，索引保存在sqlite中，可按文档增量更新
+"""
+import json
+import os
+import re
+import sqlite3
+import time
+from typing import List, Dict
+
+from tree import Tree, Node
+
+CJK_COMPILE = re.compile(r'[\u4e00-\u9fa5]+')
+WORD_COMPILE = re.compile(r'[a-zA-Z0-9]+')
+# 路径中各级标题的分隔符
+PATH_SEP = ' / '
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    title TEXT,
+    updated REAL
+);
+CREATE TABLE IF NOT EXISTS headings (
+    id INTEGER PRIMARY KEY,
+    doc_id INTEGER NOT NULL,
+    path TEXT,
+    level INTEGER,
+    page INTEGER
+);
+CREATE INDEX IF NOT EXISTS headings_doc ON headings (doc_id);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    heading_id INTEGER NOT NULL,
+    PRIMARY KEY (term, heading_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_heading ON postings (heading_id);
+'''
+
+
+def tokenize(text: str, for_query=False) -> List[str]:
+    """
+    切词：中文取每个单字及相邻两字，英文、数字取小写单词。
+    索引单字后单字查询也能命中；查询时连续多字只取相邻两字，结果相同而匹配的词更少
+    :param text:
+    :param for_query: 是否为查询语句
+    :return: 去重后的词列表，保持出现顺序
+    """
+    terms = []
+
+    for m in CJK_COMPILE.finditer(text or ''):
+        s = m.group()
+        if len(s) == 1 or not for_query:
+            terms.extend(s)
+        terms.extend(s[i:i + 2] for i in range(len(s) - 1))
+
+    terms.extend(w.lower() for w in WORD_COMPILE.findall(text or ''))
+
+    return list(dict.fromkeys(terms))
+
+
+def read_tree(fpath) -> Tree:
+    """
+    读取`Tree.dump_json`或`Tree.dump_jsonl`保存的目录
+    :param fpath: 结果文件路径
+    :return:
+    """
+    with open(fpath, encoding='utf-8') as f:
+        if fpath.endswith('.jsonl'):
+            nodes = dict()
+            for line in f:
+                record = json.loads(line)
+                parent = record.pop('parent')
+                node = nodes[record.pop('id')] = Node(**record)
+                if parent is not None:
+                    nodes[parent].children.append(node)
+            return Tree(nodes.get(0))
+
+        root = Node()
+        stack = [(json.load(f), root)]
+        while stack:
+            item, node = stack.pop()
+            for k, v in item.items():
+                if k != 'children':
+                    setattr(node, k, v)
+
+            for ch in item['children']:
+                child = Node()
+                node.children.append(child)
+                stack.append((ch, child))
+
+        return Tree(root)
+
+
+class TocIndex(object):
+    def __init__(self, db_path):
+        dir_name = os.path.dirname(db_path)
+        if dir_name and not os.path.exists(dir_name):
+            os.makedirs(dir_name)
+
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def updated_at(self, doc_path) -> float:
+        """文档最近一次索引的时间，未索引时为0"""
+        row = self.conn.execute('SELECT updated FROM documents WHERE path = ?', (doc_path,)).fetchone()
+        return row[0] if row else 0
+
+    def add_tree(self, doc_path, tree: Tree):
+        """
+        索引一篇文档的目录，已索引过的文档先删除旧记录
+        :param doc_path: 文档路径，作为文档的唯一标识
+        :param tree: 目录树
+        :return:
+        """
+        with self.conn:
+            self.remove(doc_path, commit=False)
+
+            cur = self.conn.execute(
+                'INSERT INTO documents (path, title, updated) VALUES (?, ?, ?)',
+                (doc_path, getattr(tree.root, 'text', None), time.time())
+            )
+            doc_id = cur.lastrowid
+
+            for node, path in tree.iter_paths():
+                # 根结点为文章标题，空结点为补齐层级用的占位结点
+                text = getattr(node, 'text', '')
+                if node is tree.root or not text:
+                    continue
+
+                cur = self.conn.execute(
+                    'INSERT INTO headings (doc_id, path, level, page) VALUES (?, ?, ?, ?)',
+                    (doc_id, PATH_SEP.join(p for p in path[1:] if p),
+                     getattr(node, 'level', None), getattr(node, 'page_number', None))
+                )
+                self.conn.executemany(
+                    'INSERT OR IGNORE INTO postings (term, heading_id) VALUES (?, ?)',
+                    [(term, cur.lastrowid) for term in tokenize(text)]
+                )
+
+    def remove(self, doc_path, commit=True):
+        row = self.conn.execute('SELECT id FROM documents WHERE path = ?', (doc_path,)).fetchone()
+        if row is None:
+            return
+
+        self.conn.execute(
+            'DELETE FROM postings WHERE heading_id IN (SELECT id FROM headings WHERE doc_id = ?)', row
+        )
+        self.conn.execute('DELETE FROM headings WHERE doc_id = ?', row)
+        self.conn.execute('DELETE FROM documents WHERE id = ?', row)
+
+        if commit:
+            self.conn.commit()
+
+    def search(self, query: str, limit=20) -> List[Dict]:
+        """
+        查找包含查询中所有词的标题
+        :param query: 查询语句
+        :param limit: 最多返回的条数
+        :return: [{'document', 'title', 'path', 'level', 'page'}, ...]
+        """
+        terms = tokenize(query, for_query=True)
+        if not terms:
+            return []
+
+        sql = '''
+            SELECT d.path, d.title, h.path, h.level, h.page
+            FROM (
+                SELECT heading_id FROM postings
+                WHERE term IN ({})
+                GROUP BY heading_id HAVING COUNT(*) = ?
+                LIMIT ?
+            ) AS m
+            JOIN headings h ON h.id = m.heading_id
+            JOIN documents d ON d.id = h.doc_id
+            ORDER BY d.path, h.id
+        '''.format(','.join('?' * len(terms)))
+
+        rows = self.conn.execute(sql, terms + [len(terms), limit])
+
+        return [
+            dict(document=r[0], title=r[1], path=r[2], level=r[3], page=r[4])
+            for r in rows
+        ]
@@ -1,4 +1,5 @@
 import functools
+import json
 from collections import deque
 
 
@@ -34,21 +35,24 @@ class Tree:
         self.root = root
 
     @tree_verify
-    def level_order(self):
+    def iter_level_order(self):
         """
-        层序遍历
+        层序遍历，逐个返回结点
         :return:
         """
-        result = [self.root]
         q = deque([self.root])
 
         while q:
             last_node = q.popleft()
-            for ch in last_node.children:
-                result.append(ch)
-                q.append(ch)
+            yield last_node
+            q.extend(last_node.children)
 
-        return result
+    def level_order(self):
+        """
+        层序遍历
+        :return:
+        """
+        return list(self.iter_level_order())
 
     @tree_verify
     def find_parent_node(self, node):
@@ -73,17 +77,19 @@ class Tree:
         :param root: 用于遍历的结点
         :param node: 带查找结点
         :param level: 层级，根结点值为0
-        :return:
+        :return: 找不到时返回0
         """
-        if root == node:
-            return level
+        stack = [(root, level)]
+
+        while stack:
+            cur, cur_level = stack.pop()
+            if cur == node:
+                return cur_level
+
+            for ch in cur.children[::-1]:
+                stack.append((ch, cur_level + 1))
 
-        for ch in root.children:
-            res = self.get_level(ch, node, level + 1)
-            if res != 0:
-                return res
-        else:
-            return 0
+        return 0
 
     @tree_verify
     def insert(self, p_node, node):
@@ -94,6 +100,7 @@ class Tree:
         :return:
         """
         p_node.children.append(node)
+        node.parent = p_node
 
         while p_node != self.root:
             try:
@@ -107,39 +114,139 @@ class Tree:
         return True
 
     @tree_verify
-    def pre_order(self):
-        res = []
-        stack = [self.root]
+    def iter_pre_order(self, with_depth=False):
+        """
+        先序遍历，逐个返回结点
+        :param with_depth: 为True时返回(结点, 深度)，根结点深度为0
+        :return:
+        """
+        stack = [(self.root, 0)]
 
         while stack:
-            root = stack.pop()
-            res.append(root)
+            root, depth = stack.pop()
+            yield (root, depth) if with_depth else root
 
             for ch in root.children[::-1]:
-                stack.append(ch)
+                stack.append((ch, depth + 1))
+
+    def pre_order(self):
+        return list(self.iter_pre_order())
+
+    @tree_verify
+    def iter_paths(self, attr_name='text'):
+        """
+        先序遍历，返回每个结点及从根结点到该结点的路径
+        :param attr_name: 路径中使用的结点属性
+        :return: (结点, 路径元组)
+        """
+        path = []
 
-        return res
+        for node, depth in self.iter_pre_order(with_depth=True):
+            del path[depth:]
+            path.append(getattr(node, attr_name, ''))
+            yield node, tuple(path)
+
+    def find_path(self, node, attr_name='text'):
+        """
+        从根结点到`node`的路径，经`insert`插入的结点沿父结点向上查找，否则遍历整棵树
+        :param node: 待查找结点
+        :param attr_name: 路径中使用的结点属性
+        :return: 路径元组
+        """
+        path, cur = [], node
+        while cur is not None:
+            path.append(getattr(cur, attr_name, ''))
+            if cur is self.root:
+                return tuple(path[::-1])
+            cur = getattr(cur, 'parent', None)
+
+        for n, path in self.iter_paths(attr_name):
+            if n is node:
+                return path
+
+        raise NodeNotFoundError('node not found:\n{}'.format(node))
 
     @property
     def tree_dict(self):
+        """
+        以`text`为键的嵌套字典，同名的兄弟结点会被合并，需保留重复标题时使用`dump_json`
+        :return:
+        """
         attr_name = 'text'
 
-        def _to_dict(root: Node, t_dict: dict):
-            if not root.children:
-                return
+        res = dict()
+        stack = [(self.root, res)]
 
+        while stack:
+            root, t_dict = stack.pop()
             for child in root.children:
                 value = getattr(child, attr_name, '')
                 if value not in t_dict:
                     t_dict[value] = {}
-                    _to_dict(child, t_dict[value])
-                else:
-                    _to_dict(child, t_dict[value])
 
-        res = dict()
-        _to_dict(self.root, res)
+            for child in root.children[::-1]:
+                stack.append((child, t_dict[getattr(child, attr_name, '')]))
+
+        return {getattr(self.root, attr_name, None): res}
+
+    @staticmethod
+    def node_fields(node, attrs):
+        return {k: getattr(node, k, None) for k in attrs}
+
+    @tree_verify
+    def dump_json(self, fp, attrs=('text', 'level', 'page_number')):
+        """
+        将整棵树以嵌套json写入文件，每个结点为{attrs..., "children": [...]}，
+        保留结点顺序及重复标题，不生成中间字典
+        :param fp: 文本模式打开的文件对象
+        :param attrs: 需输出的结点属性
+        :return:
+        """
+        dumps = functools.partial(json.dumps, ensure_ascii=False, default=str)
+
+        def write_open(node):
+            fields = dumps(self.node_fields(node, attrs))
+            fp.write(fields[:-1])
+            fp.write(', "children": [' if len(fields) > 2 else '"children": [')
+
+        write_open(self.root)
+        # 栈中为各层尚未输出的子结点迭代器
+        stack = [iter(self.root.children)]
+        first = True
 
-        return {getattr(self.root, attr_name): res}
+        while stack:
+            child = next(stack[-1], None)
+            if child is None:
+                stack.pop()
+                fp.write(']}')
+                first = False
+                continue
+
+            if not first:
+                fp.write(', ')
+            write_open(child)
+            stack.append(iter(child.children))
+            first = True
+
+    @tree_verify
+    def dump_jsonl(self, fp, attrs=('text', 'level', 'page_number')):
+        """
+        按先序遍历将结点逐行写入文件，每行为{"id", "parent", "depth", attrs...}，
+        根结点id为0、parent为null
+        :param fp: 文本模式打开的文件对象
+        :param attrs: 需输出的结点属性
+        :return:
+        """
+        # 各深度上最近一个结点的id，即后续子结点的父结点
+        parents = []
+
+        for i, (node, depth) in enumerate(self.iter_pre_order(with_depth=True)):
+            del parents[depth:]
+            record = dict(id=i, parent=parents[-1] if parents else None, depth=depth)
+            record.update(self.node_fields(node, attrs))
+            fp.write(json.dumps(record, ensure_ascii=False, default=str))
+            fp.write('\n')
+            parents.append(i)
 
     @tree_verify
     def update(self, node, **kwargs):